@@ -0,0 +1,238 @@
+"""History compaction: fold older turns into a rolling summary."""
+
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langgraph.config import get_stream_writer
+from langgraph.constants import TAG_NOSTREAM
+
+from .config import get_agent_config, get_bool_config_value, get_int_config_value
+from .model import model
+from .utils import count_message_tokens
+
+_config = get_agent_config()
+COMPACTION_ENABLED = get_bool_config_value(_config, "compaction.enabled", False)
+# Compact once the unsummarized history is larger than this
+COMPACTION_TRIGGER_TOKENS = get_int_config_value(
+    _config, "compaction.trigger_tokens", 60_000
+)
+# Recent history that is always kept verbatim
+COMPACTION_KEEP_RECENT_TOKENS = get_int_config_value(
+    _config, "compaction.keep_recent_tokens", 16_000
+)
+# Tool results are cut to this many characters in the summarizer input
+COMPACTION_MAX_TOOL_OUTPUT_CHARS = get_int_config_value(
+    _config, "compaction.max_tool_output_chars", 2_000
+)
+# History is folded in slices of at most this many tokens per summarizer call
+COMPACTION_MAX_INPUT_TOKENS = get_int_config_value(
+    _config, "compaction.max_input_tokens", 32_000
+)
+# After a failed summarizer call, compaction is skipped for this long,
+# doubling with each consecutive failure
+COMPACTION_FAILURE_BACKOFF_SECONDS = get_int_config_value(
+    _config, "compaction.failure_backoff_seconds", 300
+)
+# Rough characters per token, to cap a slice that is one oversized message
+CHARS_PER_TOKEN = 4
+
+SUMMARY_SYSTEM_PROMPT = """
+You maintain a running summary of a conversation between a user and an AI assistant.
+Update the current summary with the new messages. Keep facts, decisions, user preferences,
+names of files and attachments, tool results and open questions that later turns may rely on.
+Drop small talk and anything that was superseded. Write in the language of the conversation.
+Reply with the updated summary only.
+"""
+
+# Summarizer output must not show up in the chat stream
+summary_model = model.with_config(tags=[TAG_NOSTREAM])
+
+
+def messages_after(
+    messages: List[BaseMessage], message_id: Optional[str]
+) -> List[BaseMessage]:
+    """Messages that come after ``message_id`` (all of them if not found)."""
+    if not message_id:
+        return messages
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].id == message_id:
+            return messages[i + 1 :]
+    return messages
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    parts = []
+    for item in content or []:
+        if isinstance(item, str):
+            parts.append(item)
+        elif isinstance(item, dict):
+            if item.get("type") == "text":
+                parts.append(item.get("text", ""))
+            elif item.get("type") == "image_url":
+                parts.append("[image]")
+            elif item.get("type") == "file":
+                parts.append("[file]")
+    return "\n".join(parts)
+
+
+def render_for_summary(messages: List[BaseMessage]) -> str:
+    """Plain-text transcript of messages for the summarizer."""
+    lines = []
+    for message in messages:
+        text = _content_text(message.content)
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {text}")
+        elif isinstance(message, AIMessage):
+            if text:
+                lines.append(f"Assistant: {text}")
+            for tool_call in message.tool_calls:
+                lines.append(
+                    f"Assistant called {tool_call['name']}({json.dumps(tool_call['args'])})"
+                )
+        elif isinstance(message, ToolMessage):
+            if len(text) > COMPACTION_MAX_TOOL_OUTPUT_CHARS:
+                text = text[:COMPACTION_MAX_TOOL_OUTPUT_CHARS] + " ... (truncated)"
+            lines.append(f"Tool {message.name or ''} result: {text}")
+    return "\n\n".join(lines)
+
+
+def _find_cut(messages: List[BaseMessage], counts: List[int]) -> int:
+    """Index of the first message to keep verbatim.
+
+    Everything before it is summarized. The cut is always at a user message
+    so tool calls and their results stay together, and the newest user
+    message is always kept.
+    """
+    last_human = -1
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            last_human = i
+            break
+    if last_human <= 0:
+        return 0
+
+    kept = 0
+    cut = len(messages)
+    while cut > 0 and kept + counts[cut - 1] <= COMPACTION_KEEP_RECENT_TOKENS:
+        kept += counts[cut - 1]
+        cut -= 1
+
+    while cut < last_human and not isinstance(messages[cut], HumanMessage):
+        cut += 1
+    return min(cut, last_human)
+
+
+def _slice_ends(messages: List[BaseMessage], counts: List[int]) -> List[int]:
+    """End indices of consecutive slices of at most ``COMPACTION_MAX_INPUT_TOKENS``.
+
+    A slice ends before a user message when it can, so tool calls and their
+    results are summarized together and a partly compacted history still
+    starts at a user turn.
+    """
+    ends = []
+    start = 0
+    size = 0
+    boundary = 0
+    for i, count in enumerate(counts):
+        if i > start and size + count > COMPACTION_MAX_INPUT_TOKENS:
+            end = boundary if boundary > start else i
+            ends.append(end)
+            size = sum(counts[end:i])
+            start = end
+        if i > start and isinstance(messages[i], HumanMessage):
+            boundary = i
+        size += count
+    ends.append(len(messages))
+    return ends
+
+
+async def _summarize(
+    previous_summary: str, messages: List[BaseMessage], config
+) -> str:
+    transcript = render_for_summary(messages)
+    max_chars = COMPACTION_MAX_INPUT_TOKENS * CHARS_PER_TOKEN
+    if len(transcript) > max_chars:
+        transcript = transcript[:max_chars] + " ... (truncated)"
+    prompt = [
+        SystemMessage(content=SUMMARY_SYSTEM_PROMPT.strip()),
+        HumanMessage(
+            content=f"Current summary:\n{previous_summary}\n\nNew messages:\n{transcript}"
+        ),
+    ]
+    response = await summary_model.ainvoke(prompt, config)
+    if response.usage_metadata:
+        # Not part of the messages stream; counted in the turn's usage
+        get_stream_writer()({"usage": response.usage_metadata})
+    return _content_text(response.content).strip()
+
+
+async def compact_history(state: Dict[str, Any], config=None) -> Dict[str, Any]:
+    """Graph node: summarize older turns once the history gets too large.
+
+    Messages are never removed from the state (the chat history API still
+    returns all of them); the summary and the id of the last summarized
+    message are stored alongside, and ``call_model`` only sends what comes
+    after that id. Older turns are summarized in slices of at most
+    ``compaction.max_input_tokens``, oldest first; if a call fails, the
+    slices already folded are kept and compaction is retried after a
+    backoff instead of on every turn.
+    """
+    token_counts = state.get("message_token_counts") or {}
+    history = messages_after(state["messages"], state.get("summarized_until"))
+
+    new_counts: Dict[str, int] = {}
+    counts = []
+    for message in history:
+        count = token_counts.get(message.id) if message.id else None
+        if count is None:
+            count = count_message_tokens(message)
+            if message.id:
+                new_counts[message.id] = count
+        counts.append(count)
+
+    update: Dict[str, Any] = {"message_token_counts": new_counts}
+    if sum(counts) <= COMPACTION_TRIGGER_TOKENS:
+        return update
+
+    cut = _find_cut(history, counts)
+    if cut == 0:
+        return update
+
+    if time.time() < (state.get("compaction_retry_at") or 0):
+        return update
+
+    folded = history[:cut]
+    summary = state.get("summary") or "(none)"
+    start = 0
+    for end in _slice_ends(folded, counts[:cut]):
+        try:
+            summary = await _summarize(summary, folded[start:end], config)
+        except Exception as e:
+            # Fall back to plain trimming until the backoff has passed
+            failures = (state.get("compaction_failures") or 0) + 1
+            backoff = COMPACTION_FAILURE_BACKOFF_SECONDS * 2 ** min(failures - 1, 6)
+            print(f"  ⚠️ History compaction failed, retrying in {backoff}s: {e}")
+            update["compaction_failures"] = failures
+            update["compaction_retry_at"] = time.time() + backoff
+            break
+        print(
+            f"  🗜️ Compacted {end - start} messages ({sum(counts[start:end])} tokens) into the summary"
+        )
+        update["summary"] = summary
+        update["summarized_until"] = folded[end - 1].id
+        start = end
+    else:
+        if state.get("compaction_failures"):
+            update["compaction_failures"] = 0
+            update["compaction_retry_at"] = 0.0
+    return update
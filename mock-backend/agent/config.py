@@ -61,6 +61,37 @@ def get_bool_config_value(
     raise ValueError(f"Config value {path} must be a boolean")
 
 
+def get_int_config_value(config: Dict[str, Any], path: str, default: Any = _MISSING) -> int:
+    value = get_config_value(config, path, default)
+    if isinstance(value, bool):
+        raise ValueError(f"Config value {path} must be an integer")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    if value is default and default is not _MISSING:
+        return default
+    raise ValueError(f"Config value {path} must be an integer")
+
+
+def get_float_config_value(
+    config: Dict[str, Any], path: str, default: Any = _MISSING
+) -> float:
+    value = get_config_value(config, path, default)
+    if isinstance(value, bool):
+        raise ValueError(f"Config value {path} must be a number")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            pass
+    if value is default and default is not _MISSING:
+        return default
+    raise ValueError(f"Config value {path} must be a number")
+
+
 def _normalize_openai_base_url(path: str, value: str) -> str:
     normalized = value.strip().rstrip("/")
     if not normalized.endswith("/v1"):
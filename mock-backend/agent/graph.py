@@ -1,25 +1,59 @@
 """LangGraph agent implementation."""
 
-from typing import Annotated, Dict, List, Literal, TypedDict
+import asyncio
+import threading
+import operator
+from typing import Annotated, Any, Dict, List, Literal, Tuple, TypedDict
 
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
-from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langgraph.graph import END, StateGraph
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode
 
 from lib.checkpointer import checkpointer
 
+from .compaction import COMPACTION_ENABLED, compact_history, messages_after
+from .config import get_agent_config, get_bool_config_value
 from .model import model
-from .prompt import FALLBACK_SYSTEM_PROMPT, get_prompty_client
+from .prompt import get_system_prompt
+from .tool_executor import ToolExecutor
 from .tools import AVAILABLE_TOOLS
-from .utils import change_file_to_url, sanitize_and_validate_messages
+from .utils import (
+    change_file_to_url_async,
+    count_message_tokens,
+    sanitize_new_messages,
+    trim_history,
+)
+
+# Token budget for the history sent to the model
+MAX_HISTORY_TOKENS = 120_000
+
+
+def merge_token_counts(left: Dict[str, int], right: Dict[str, int]) -> Dict[str, int]:
+    """Reducer for the per-message token count cache."""
+    if not left:
+        return right
+    if not right:
+        return left
+    return {**left, **right}
 
 
 class AgentState(TypedDict):
     """State for the agent graph."""
 
     messages: Annotated[List[BaseMessage], add_messages]
+    # Approximate token count per message id, filled in as messages are seen
+    message_token_counts: Annotated[Dict[str, int], merge_token_counts]
+    # Rolling summary of older turns and the id of the last message it covers
+    summary: str
+    summarized_until: str
+    # Consecutive failed compactions and when to try again (epoch seconds)
+    compaction_failures: int
+    compaction_retry_at: float
+    # Id of the last message already checked by the sanitizer, and the ids it
+    # dropped up to there
+    validated_until: str
+    dropped_message_ids: Annotated[List[str], operator.add]
 
 
 def should_continue(state: AgentState) -> Literal["tools", "end"]:
@@ -46,66 +80,130 @@ def should_continue(state: AgentState) -> Literal["tools", "end"]:
     return "end"
 
 
-def call_model(state: AgentState, config=None) -> Dict[str, List[BaseMessage]]:
-    """Call the model with the current state.
+def prepare_model_messages(
+    state: AgentState,
+) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+    """Build the message list sent to the model for the current state.
+
+    This does blocking work (Prompty lookup) and is meant to be run off the
+    event loop. ``chatbot://`` attachments are resolved afterwards by
+    ``change_file_to_url_async``.
 
     Args:
         state: Current agent state
-        config: Configuration dictionary
 
     Returns:
-        Dict containing the updated messages
+        Tuple of the system prompt followed by the trimmed history, and the
+        state update with the token counts and sanitizer marker
     """
-    messages = state["messages"]
+    summary = state.get("summary")
+    messages = messages_after(state["messages"], state.get("summarized_until"))
 
     # Trim messages to fit within token limit
-    messages = trim_messages(
-        state["messages"],
-        strategy="last",
-        token_counter=count_tokens_approximately,
-        max_tokens=120_000,
-        start_on="human",
-        end_on=("human", "tool"),
+    messages, new_counts = trim_history(
+        messages, state.get("message_token_counts") or {}, MAX_HISTORY_TOKENS
+    )
+
+    # Sanitize and validate messages to ensure proper tool call/response
+    # pairing; only messages added since the last call are checked
+    messages, validated_until, newly_dropped = sanitize_new_messages(
+        messages,
+        state.get("validated_until"),
+        set(state.get("dropped_message_ids") or ()),
     )
 
-    # Sanitize and validate messages to ensure proper tool call/response pairing
-    messages = sanitize_and_validate_messages(messages)
+    prompt = get_system_prompt("Main Chat Agent").strip()
+    if summary:
+        prompt += f"\n\n# Summary of the earlier conversation\n\n{summary}"
 
-    # Convert chatbot://{id} URLs to temporary blob URLs with SAS tokens
-    messages = change_file_to_url(messages)
+    system_msg = SystemMessage(content=prompt)
 
-    try:
-        prompty = get_prompty_client()
-        prompt = prompty.get_prompt("Main Chat Agent")
-    except:
-        prompt = FALLBACK_SYSTEM_PROMPT
+    update: Dict[str, Any] = {"message_token_counts": new_counts}
+    if validated_until:
+        update["validated_until"] = validated_until
+    if newly_dropped:
+        update["dropped_message_ids"] = newly_dropped
+    return [system_msg] + messages, update
 
-    system_msg = SystemMessage(content=prompt.strip())
-    messages = [system_msg] + messages
 
-    # Bind tools to the model
-    model_with_tools = model.bind_tools(AVAILABLE_TOOLS)
-    response = model_with_tools.invoke(messages)
+async def call_model(state: AgentState, config=None) -> Dict[str, Any]:
+    """Call the model with the current state.
+
+    Args:
+        state: Current agent state
+        config: Configuration dictionary
+
+    Returns:
+        Dict containing the updated messages
+    """
+    # Keep the event loop free while the history is prepared
+    messages, update = await asyncio.to_thread(prepare_model_messages, state)
+
+    # Resolve chatbot://{id} attachments concurrently
+    messages = await change_file_to_url_async(messages)
+
+    model_with_tools = bind_model_tools(AVAILABLE_TOOLS)
+    response = await model_with_tools.ainvoke(messages, config)
+
+    if response.id:
+        update["message_token_counts"][response.id] = count_message_tokens(response)
 
     # Return the response
-    return {"messages": [response]}
+    update["messages"] = [response]
+    return update
 
 
-def get_graph():
-    """Get or create the graph instance.
+# Model with the tool schemas bound, keyed by the model and tool registry it
+# was built from
+_bound_model: Tuple[Tuple[int, ...], Any] = ((), None)
+
+
+def bind_model_tools(tools: List[Any]):
+    """Get the model with ``tools`` bound, reusing the previous binding.
 
-    Graph is rebuilt on every call to ensure tool changes are picked up.
-    This may add slight latency but ensures correctness during development.
+    Converting every tool's pydantic schema to OpenAI function JSON is done
+    once here instead of on every model call; the binding is only rebuilt
+    when the model or the set of tools changes.
     """
-    # Create the graph fresh every time
+    global _bound_model
+
+    key = (id(model), *(id(t) for t in tools))
+    bound_key, bound = _bound_model
+    if bound is not None and bound_key == key:
+        return bound
+
+    schemas = [convert_to_openai_tool(t) for t in tools]
+    bound = model.bind_tools(schemas)
+    _bound_model = (key, bound)
+    print(f"🔧 Bound {len(schemas)} tool schemas to the model")
+    return bound
+
+
+# Process-wide compiled graph, built once and shared by every request
+_compiled_graph = None
+_graph_lock = threading.Lock()
+
+
+def build_graph():
+    """Build and compile the agent graph from the current AVAILABLE_TOOLS."""
     workflow = StateGraph(AgentState)
 
+    # Serialize the tool schemas up front rather than on the first model call
+    bind_model_tools(AVAILABLE_TOOLS)
+
     # Add nodes
     workflow.add_node("agent", call_model)
-    workflow.add_node("tools", ToolNode(AVAILABLE_TOOLS))
-
-    # Set the entrypoint as agent
-    workflow.set_entry_point("agent")
+    # Runs the tool calls of one model response concurrently
+    workflow.add_node("tools", ToolExecutor(AVAILABLE_TOOLS).run)
+
+    if COMPACTION_ENABLED:
+        # Summarize older turns once per user turn, before the model runs
+        workflow.add_node("compact", compact_history)
+        workflow.set_entry_point("compact")
+        workflow.add_edge("compact", "agent")
+    else:
+        # Set the entrypoint as agent
+        workflow.set_entry_point("agent")
 
     # Add conditional edges
     workflow.add_conditional_edges(
@@ -126,3 +224,40 @@ def get_graph():
     graph = workflow.compile(checkpointer=checkpointer_ins)
 
     return graph
+
+
+def get_graph():
+    """Get the process-wide compiled graph, building it on first use.
+
+    When ``graph.reload_on_request`` is enabled in the agent config the graph
+    is rebuilt on every call so tool changes are picked up during development.
+    """
+    global _compiled_graph
+
+    if get_bool_config_value(get_agent_config(), "graph.reload_on_request", False):
+        return build_graph()
+
+    if _compiled_graph is not None:
+        return _compiled_graph
+
+    with _graph_lock:
+        if _compiled_graph is None:
+            _compiled_graph = build_graph()
+            print("✅ LangGraph compiled and cached")
+
+    return _compiled_graph
+
+
+def reload_graph():
+    """Rebuild the cached graph, e.g. after AVAILABLE_TOOLS has changed.
+
+    Streams that are already running keep the graph they started with.
+    """
+    global _compiled_graph
+
+    graph = build_graph()
+    with _graph_lock:
+        _compiled_graph = graph
+
+    print(f"🔄 LangGraph reloaded with tools: {[t.name for t in AVAILABLE_TOOLS]}")
+    return graph
@@ -0,0 +1,171 @@
+"""Long-lived HTTP clients for the OpenAI-compatible chat model endpoint."""
+
+import asyncio
+import importlib.util
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from .config import (
+    get_agent_config,
+    get_bool_config_value,
+    get_float_config_value,
+    get_int_config_value,
+)
+
+_EndpointKey = Tuple[str, bool]
+
+
+class ModelHttpClients:
+    """Owns one sync and one async httpx client per LLM endpoint.
+
+    Clients are created lazily, reused for the lifetime of the process so TLS
+    sessions and keep-alive connections survive between requests, and closed
+    from the FastAPI shutdown hook. Pool and timeout settings are read from
+    ``llm.http.*`` in the agent config.
+    """
+
+    def __init__(self):
+        config = get_agent_config()
+
+        self.max_connections = get_int_config_value(
+            config, "llm.http.max_connections", 100
+        )
+        self.max_keepalive_connections = get_int_config_value(
+            config, "llm.http.max_keepalive_connections", 20
+        )
+        self.keepalive_expiry = get_float_config_value(
+            config, "llm.http.keepalive_expiry_seconds", 120.0
+        )
+        self.connect_timeout = get_float_config_value(
+            config, "llm.http.connect_timeout_seconds", 10.0
+        )
+        self.read_timeout = get_float_config_value(
+            config, "llm.http.read_timeout_seconds", 120.0
+        )
+        self.write_timeout = get_float_config_value(
+            config, "llm.http.write_timeout_seconds", 30.0
+        )
+        self.pool_timeout = get_float_config_value(
+            config, "llm.http.pool_timeout_seconds", 10.0
+        )
+        self.warmup_enabled = get_bool_config_value(config, "llm.http.warmup", True)
+        self.http2 = get_bool_config_value(config, "llm.http.http2", False)
+
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            print("  ⚠️ llm.http.http2 is enabled but the 'h2' package is missing, using HTTP/1.1")
+            self.http2 = False
+
+        self._sync_clients: Dict[_EndpointKey, httpx.Client] = {}
+        self._async_clients: Dict[_EndpointKey, httpx.AsyncClient] = {}
+        self._warmup_headers: Dict[_EndpointKey, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _client_kwargs(self, verify_ssl: bool) -> Dict[str, Any]:
+        return {
+            "verify": verify_ssl,
+            "http2": self.http2,
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(
+                connect=self.connect_timeout,
+                read=self.read_timeout,
+                write=self.write_timeout,
+                pool=self.pool_timeout,
+            ),
+        }
+
+    def _register(self, base_url: str, verify_ssl: bool, api_key: Optional[str]):
+        key = (base_url.rstrip("/"), verify_ssl)
+        if api_key and key not in self._warmup_headers:
+            self._warmup_headers[key] = {"Authorization": f"Bearer {api_key}"}
+        return key
+
+    def get_client(
+        self, base_url: str, verify_ssl: bool = True, api_key: Optional[str] = None
+    ) -> httpx.Client:
+        """Get the shared sync client for an endpoint."""
+        with self._lock:
+            key = self._register(base_url, verify_ssl, api_key)
+            if key not in self._sync_clients:
+                self._sync_clients[key] = httpx.Client(
+                    **self._client_kwargs(verify_ssl)
+                )
+            return self._sync_clients[key]
+
+    def get_async_client(
+        self, base_url: str, verify_ssl: bool = True, api_key: Optional[str] = None
+    ) -> httpx.AsyncClient:
+        """Get the shared async client for an endpoint."""
+        with self._lock:
+            key = self._register(base_url, verify_ssl, api_key)
+            if key not in self._async_clients:
+                self._async_clients[key] = httpx.AsyncClient(
+                    **self._client_kwargs(verify_ssl)
+                )
+            return self._async_clients[key]
+
+    async def warm_up(self):
+        """Open a pooled connection to every endpoint so the first chat turn
+        does not pay for DNS and the TLS handshake."""
+        if not self.warmup_enabled:
+            return
+
+        async def _warm_async(key: _EndpointKey, client: httpx.AsyncClient):
+            base_url, _ = key
+            try:
+                await client.get(
+                    f"{base_url}/models",
+                    headers=self._warmup_headers.get(key, {}),
+                    timeout=self.connect_timeout,
+                )
+                print(f"  🔥 Warmed async connection to {base_url}")
+            except Exception as e:
+                print(f"  ⚠️ Async warm-up failed for {base_url}: {e}")
+
+        def _warm_sync(key: _EndpointKey, client: httpx.Client):
+            base_url, _ = key
+            try:
+                client.get(
+                    f"{base_url}/models",
+                    headers=self._warmup_headers.get(key, {}),
+                    timeout=self.connect_timeout,
+                )
+                print(f"  🔥 Warmed sync connection to {base_url}")
+            except Exception as e:
+                print(f"  ⚠️ Sync warm-up failed for {base_url}: {e}")
+
+        with self._lock:
+            async_clients = list(self._async_clients.items())
+            sync_clients = list(self._sync_clients.items())
+
+        await asyncio.gather(
+            *[_warm_async(key, client) for key, client in async_clients],
+            *[
+                asyncio.to_thread(_warm_sync, key, client)
+                for key, client in sync_clients
+            ],
+        )
+
+    async def aclose(self):
+        """Close every client. Called from the FastAPI shutdown hook."""
+        with self._lock:
+            async_clients = list(self._async_clients.values())
+            sync_clients = list(self._sync_clients.values())
+            self._async_clients.clear()
+            self._sync_clients.clear()
+
+        for client in async_clients:
+            await client.aclose()
+        for client in sync_clients:
+            client.close()
+
+        if async_clients or sync_clients:
+            print("🔌 Model HTTP clients closed")
+
+
+model_http_clients = ModelHttpClients()
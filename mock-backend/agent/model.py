@@ -1,42 +1,17 @@
 """Model configuration for OpenAI-compatible agent integration."""
 
-import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from pydantic import SecretStr
 from typing import cast
 
 from .config import get_agent_config, get_bool_config_value, get_required_config_value
+from .http_clients import model_http_clients
 
 # Load environment variables
 load_dotenv()
 
 
-# Create HTTP clients with SSL verification disabled for unverified certificates
-def _create_http_client(verify_ssl: bool = True) -> httpx.Client:
-    """Create an httpx client with configurable SSL verification.
-
-    Args:
-        verify_ssl: Whether to verify SSL certificates. Default True.
-
-    Returns:
-        httpx.Client: Configured HTTP client
-    """
-    return httpx.Client(verify=verify_ssl)
-
-
-def _create_async_http_client(verify_ssl: bool = True) -> httpx.AsyncClient:
-    """Create an async httpx client with configurable SSL verification.
-
-    Args:
-        verify_ssl: Whether to verify SSL certificates. Default True.
-
-    Returns:
-        httpx.AsyncClient: Configured async HTTP client
-    """
-    return httpx.AsyncClient(verify=verify_ssl)
-
-
 def create_openai_model(verify_ssl: bool = True, **kwargs) -> ChatOpenAI:
     """Create an OpenAI model instance with optional SSL verification.
 
@@ -60,7 +35,13 @@ def create_openai_model(verify_ssl: bool = True, **kwargs) -> ChatOpenAI:
         api_key=SecretStr(api_key),
         # temperature=0.5,
         streaming=True,
-        http_client=_create_http_client(verify_ssl=verify_ssl),
+        # Ask for usage_metadata on the final chunk of every streamed call
+        stream_usage=True,
+        # Shared pooled clients so connections and TLS sessions are reused
+        http_client=model_http_clients.get_client(base_url, verify_ssl, api_key),
+        http_async_client=model_http_clients.get_async_client(
+            base_url, verify_ssl, api_key
+        ),
         **kwargs,
     )
 
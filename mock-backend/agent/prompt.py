@@ -1,11 +1,32 @@
 import dotenv
-from typing import cast
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple, cast
 
 dotenv.load_dotenv()
 
 from prompty import PromptyClient
 
-from .config import get_agent_config, get_bool_config_value, get_required_config_value
+from lib.metrics import Counter
+
+from .config import (
+    get_agent_config,
+    get_bool_config_value,
+    get_int_config_value,
+    get_required_config_value,
+)
+
+PROMPT_CACHE_REQUESTS = Counter(
+    "prompt_cache_requests_total",
+    "System prompt lookups by cache result (hit, stale, miss, backoff)",
+    ["result"],
+)
+PROMPT_FETCH_FAILURES = Counter(
+    "prompt_fetch_failures_total",
+    "Failed Prompty fetches by what was served instead",
+    ["served"],
+)
 
 FALLBACK_SYSTEM_PROMPT = """
 You are MII Chat, a large language model based on the GPT-5.2 model developed by PT. Mitra Integrasi Informatika - Microsoft AI Division.
@@ -257,3 +278,133 @@ def get_prompty_client() -> PromptyClient:
             ),
         )
     return _prompty_client
+
+
+class PromptCache:
+    """TTL cache for Prompty prompts with stale-while-revalidate.
+
+    A prompt younger than ``ttl`` is served from memory. An older one is
+    still served right away while a background thread fetches a fresh copy;
+    only once it is older than ``ttl + max_stale`` (or on first use) does
+    the caller wait for Prompty. When a fetch fails the last prompt that was
+    fetched successfully is used, and ``FALLBACK_SYSTEM_PROMPT`` only when
+    Prompty never answered.
+
+    After a failed fetch, nothing is fetched for ``failure_backoff``, and
+    until a fetch succeeds again callers never wait for Prompty when a
+    prompt was fetched before: it is served and refreshed in the background.
+    """
+
+    def __init__(
+        self, ttl_seconds: int, max_stale_seconds: int, failure_backoff_seconds: int
+    ):
+        self.ttl = ttl_seconds
+        self.max_stale = max_stale_seconds
+        self.failure_backoff = failure_backoff_seconds
+        # agent name -> (prompt text, monotonic fetch time); also the last
+        # known good value, entries are only replaced by successful fetches
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._refreshing: Set[str] = set()
+        # agent name -> monotonic time of the last failed fetch, cleared by a
+        # successful one
+        self._failed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="prompt-refresh"
+        )
+
+    def _fetch(self, agent_name: str) -> Optional[str]:
+        """Fetch from Prompty and update the cache. Returns None on failure."""
+        try:
+            prompt = get_prompty_client().get_prompt(agent_name)
+            if not prompt:
+                raise ValueError(f"Prompty returned an empty prompt for {agent_name}")
+        except Exception as e:
+            print(f"  ⚠️ Failed to fetch prompt '{agent_name}' from Prompty: {e}")
+            with self._lock:
+                self._failed_at[agent_name] = time.monotonic()
+            return None
+
+        with self._lock:
+            self._entries[agent_name] = (prompt, time.monotonic())
+            self._failed_at.pop(agent_name, None)
+        return prompt
+
+    def _backing_off(self, agent_name: str) -> bool:
+        failed_at = self._failed_at.get(agent_name)
+        return (
+            failed_at is not None
+            and time.monotonic() - failed_at < self.failure_backoff
+        )
+
+    def _refresh_in_background(self, agent_name: str):
+        with self._lock:
+            if agent_name in self._refreshing or self._backing_off(agent_name):
+                return
+            self._refreshing.add(agent_name)
+
+        def refresh():
+            try:
+                if self._fetch(agent_name) is None:
+                    PROMPT_FETCH_FAILURES.inc(served="last_known_good")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(agent_name)
+
+        self._executor.submit(refresh)
+
+    def get(self, agent_name: str) -> str:
+        with self._lock:
+            entry = self._entries.get(agent_name)
+            failed = agent_name in self._failed_at
+            backing_off = self._backing_off(agent_name)
+
+        if entry is not None:
+            prompt, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                PROMPT_CACHE_REQUESTS.inc(result="hit")
+                return prompt
+            # Past max_stale the caller only waits while Prompty is healthy
+            if age < self.ttl + self.max_stale or failed:
+                PROMPT_CACHE_REQUESTS.inc(result="stale")
+                self._refresh_in_background(agent_name)
+                return prompt
+        elif backing_off:
+            PROMPT_CACHE_REQUESTS.inc(result="backoff")
+            return FALLBACK_SYSTEM_PROMPT
+
+        PROMPT_CACHE_REQUESTS.inc(result="miss")
+        prompt = self._fetch(agent_name)
+        if prompt is not None:
+            return prompt
+
+        if entry is not None:
+            PROMPT_FETCH_FAILURES.inc(served="last_known_good")
+            return entry[0]
+        PROMPT_FETCH_FAILURES.inc(served="fallback")
+        return FALLBACK_SYSTEM_PROMPT
+
+
+_config = get_agent_config()
+PROMPTY_ENABLED = get_bool_config_value(_config, "prompty.enabled", False)
+prompt_cache = PromptCache(
+    ttl_seconds=get_int_config_value(_config, "prompty.cache_ttl_seconds", 300),
+    max_stale_seconds=get_int_config_value(
+        _config, "prompty.cache_max_stale_seconds", 3600
+    ),
+    failure_backoff_seconds=get_int_config_value(
+        _config, "prompty.failure_backoff_seconds", 30
+    ),
+)
+
+
+def get_system_prompt(agent_name: str = "Main Chat Agent") -> str:
+    """System prompt for an agent: cached Prompty prompt, or the fallback.
+
+    May block on a Prompty request on a cache miss; call it off the event
+    loop.
+    """
+    if not PROMPTY_ENABLED:
+        return FALLBACK_SYSTEM_PROMPT
+    return prompt_cache.get(agent_name)
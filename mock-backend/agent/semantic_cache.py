@@ -0,0 +1,331 @@
+"""Semantic answer cache for repeated first questions."""
+
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langgraph.graph.state import CompiledStateGraph
+from openai import AsyncOpenAI
+
+from lib.metrics import Counter, Gauge, Histogram
+from utils.stream_protocol import ChatStream, TurnReplay
+
+from .config import (
+    get_agent_config,
+    get_bool_config_value,
+    get_config_value,
+    get_float_config_value,
+    get_int_config_value,
+    get_required_config_value,
+)
+
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "semantic_cache_lookups_total",
+    "Semantic answer cache lookups by result",
+    ["result"],
+)
+SEMANTIC_CACHE_SIMILARITY = Histogram(
+    "semantic_cache_similarity",
+    "Cosine similarity of the closest cached question",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.93, 0.95, 0.97, 0.99, 1.0),
+)
+SEMANTIC_CACHE_LOOKUP_SECONDS = Histogram(
+    "semantic_cache_lookup_seconds",
+    "Time spent embedding the question and searching the cache",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+SEMANTIC_CACHE_SAVED_SECONDS = Histogram(
+    "semantic_cache_latency_saved_seconds",
+    "Duration of the original turn minus the lookup time, per cache hit",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 40, 80, 160),
+)
+SEMANTIC_CACHE_SAVED_TOKENS = Counter(
+    "semantic_cache_saved_tokens_total",
+    "Model tokens of the original turns answered from the cache",
+)
+SEMANTIC_CACHE_ENTRIES = Gauge(
+    "semantic_cache_entries", "Answers held in the semantic cache"
+)
+
+
+@dataclass
+class CachedTurn:
+    question: str
+    frames: List[str]
+    messages: List[BaseMessage]
+    duration: float
+    tokens: int
+    created_at: float
+
+
+@dataclass
+class CacheLookup:
+    """Result of a lookup for a question that may be answered from the cache."""
+
+    scope: str
+    question: str
+    vector: np.ndarray
+    turn: Optional[CachedTurn] = None
+    similarity: float = 0.0
+
+    def replay(self) -> TurnReplay:
+        """The cached turn, with fresh message ids for the new thread."""
+        turn = self.turn
+        assert turn is not None
+        messages = [m.model_copy(update={"id": str(uuid.uuid4())}) for m in turn.messages]
+        return TurnReplay(messages=messages, frames=turn.frames)
+
+
+class _ScopeIndex:
+    """Unit-length question vectors of one scope, oldest first."""
+
+    def __init__(self):
+        self.vectors: Optional[np.ndarray] = None
+        self.turns: List[CachedTurn] = []
+
+    def add(self, vector: np.ndarray, turn: CachedTurn):
+        row = vector[np.newaxis, :]
+        self.vectors = row if self.vectors is None else np.vstack([self.vectors, row])
+        self.turns.append(turn)
+
+    def drop_oldest(self, count: int):
+        if self.vectors is not None:
+            self.vectors = self.vectors[count:]
+        del self.turns[:count]
+
+
+class SemanticCache:
+    """Answers repeated questions with the stream of an earlier answer.
+
+    Only the first message of a conversation is looked up, and only when it
+    is plain text: later turns depend on the conversation so far. The
+    question is embedded with the AI Search embedding client and compared
+    by cosine similarity with earlier questions of the same scope (the user,
+    or everyone with ``scope: "global"``). Above ``similarity_threshold``
+    the earlier turn is written to the new thread and its frames replayed.
+
+    Completed first turns are stored unless they called one of
+    ``uncacheable_tools``, whose answers depend on when they were asked.
+    Entries expire after ``ttl_seconds``; at most ``max_entries`` are kept
+    per worker, dropping the oldest entries of the least recently used
+    scope first.
+    """
+
+    def __init__(self):
+        config = get_agent_config()
+        self.enabled = get_bool_config_value(config, "semantic_cache.enabled", False)
+        self.similarity_threshold = get_float_config_value(
+            config, "semantic_cache.similarity_threshold", 0.95
+        )
+        self.scope = get_config_value(config, "semantic_cache.scope", "user")
+        self.ttl_seconds = get_int_config_value(
+            config, "semantic_cache.ttl_seconds", 3600
+        )
+        self.max_entries = get_int_config_value(
+            config, "semantic_cache.max_entries", 10_000
+        )
+        self.uncacheable_tools = set(
+            get_config_value(
+                config,
+                "semantic_cache.uncacheable_tools",
+                ["get_current_time", "web_search", "generate_image", "python"],
+            )
+        )
+
+        self._client: Optional[AsyncOpenAI] = None
+        self._embedding_model = ""
+        if self.enabled and not get_bool_config_value(
+            config, "tools.ai_search.openai_embedding.enabled", False
+        ):
+            print(
+                "  ⚠️ semantic_cache needs tools.ai_search.openai_embedding, semantic cache disabled"
+            )
+            self.enabled = False
+        if self.enabled:
+            self._client = AsyncOpenAI(
+                base_url=get_required_config_value(
+                    config, "tools.ai_search.openai_embedding.base_url"
+                ),
+                api_key=get_required_config_value(
+                    config, "tools.ai_search.openai_embedding.api_key"
+                ),
+            )
+            self._embedding_model = get_required_config_value(
+                config, "tools.ai_search.openai_embedding.model_id"
+            )
+
+        self._scopes: "OrderedDict[str, _ScopeIndex]" = OrderedDict()
+        self._size = 0
+
+    def _scope_key(self, userid: str) -> str:
+        return "*" if self.scope == "global" else userid
+
+    async def _embed(self, text: str) -> np.ndarray:
+        assert self._client is not None
+        response = await self._client.embeddings.create(
+            input=text, model=self._embedding_model
+        )
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _prune(self, index: _ScopeIndex):
+        expired = 0
+        cutoff = time.time() - self.ttl_seconds
+        while expired < len(index.turns) and index.turns[expired].created_at < cutoff:
+            expired += 1
+        if expired:
+            index.drop_oldest(expired)
+            self._size -= expired
+            SEMANTIC_CACHE_ENTRIES.set(self._size)
+
+    async def lookup(
+        self,
+        graph: CompiledStateGraph,
+        input_message: Sequence[HumanMessage],
+        conversation_id: str,
+        userid: str,
+    ) -> Optional[CacheLookup]:
+        """Look up the answer to the first question of a conversation.
+
+        Returns None when the turn is not eligible for the cache; otherwise
+        a lookup whose ``turn`` is set on a hit.
+        """
+        if not self.enabled:
+            return None
+
+        question = _plain_text(input_message)
+        if question is None:
+            SEMANTIC_CACHE_LOOKUPS.inc(result="ineligible")
+            return None
+
+        started = time.monotonic()
+        try:
+            state = await graph.aget_state({"configurable": {"thread_id": conversation_id}})
+            if state.values and state.values.get("messages"):
+                SEMANTIC_CACHE_LOOKUPS.inc(result="ineligible")
+                return None
+            vector = await self._embed(question)
+        except Exception as e:
+            print(f"  ⚠️ Semantic cache lookup failed: {e}")
+            SEMANTIC_CACHE_LOOKUPS.inc(result="error")
+            return None
+
+        scope = self._scope_key(userid)
+        lookup = CacheLookup(scope=scope, question=question, vector=vector)
+        index = self._scopes.get(scope)
+        if index is not None:
+            self._scopes.move_to_end(scope)
+            self._prune(index)
+        if index is not None and index.vectors is not None and len(index.turns):
+            similarities = index.vectors @ vector
+            best = int(np.argmax(similarities))
+            lookup.similarity = float(similarities[best])
+            SEMANTIC_CACHE_SIMILARITY.observe(lookup.similarity)
+            if lookup.similarity >= self.similarity_threshold:
+                lookup.turn = index.turns[best]
+
+        elapsed = time.monotonic() - started
+        SEMANTIC_CACHE_LOOKUP_SECONDS.observe(elapsed)
+        if lookup.turn is None:
+            SEMANTIC_CACHE_LOOKUPS.inc(result="miss")
+            return lookup
+
+        SEMANTIC_CACHE_LOOKUPS.inc(result="hit")
+        SEMANTIC_CACHE_SAVED_SECONDS.observe(max(lookup.turn.duration - elapsed, 0))
+        if lookup.turn.tokens:
+            SEMANTIC_CACHE_SAVED_TOKENS.inc(lookup.turn.tokens)
+        print(
+            f"  ♻️ Answering from the semantic cache (similarity {lookup.similarity:.3f}): '{lookup.turn.question[:80]}'"
+        )
+        return lookup
+
+    async def store(self, lookup: CacheLookup, stream: ChatStream):
+        """Cache a turn that missed, once it has finished streaming."""
+        if stream.stats.outcome != "completed" or not stream.captured_frames:
+            return
+        duration = time.monotonic() - stream.stats.started
+
+        try:
+            state = await stream.graph.aget_state(
+                {"configurable": {"thread_id": stream.conversation_id}}
+            )
+        except Exception as e:
+            print(f"  ⚠️ Failed to read the turn for the semantic cache: {e}")
+            return
+        messages = state.values.get("messages", []) if state.values else []
+        if not _cacheable_turn(messages, self.uncacheable_tools):
+            return
+
+        usage = stream.stats.usage_totals()
+        turn = CachedTurn(
+            question=lookup.question,
+            frames=list(stream.captured_frames),
+            messages=list(messages[1:]),
+            duration=duration,
+            tokens=usage["prompt_tokens"] + usage["completion_tokens"],
+            created_at=time.time(),
+        )
+
+        index = self._scopes.get(lookup.scope)
+        if index is None:
+            index = self._scopes[lookup.scope] = _ScopeIndex()
+        self._scopes.move_to_end(lookup.scope)
+        index.add(lookup.vector, turn)
+        self._size += 1
+
+        while self._size > self.max_entries and self._scopes:
+            scope, oldest = next(iter(self._scopes.items()))
+            if len(oldest.turns) <= 1:
+                del self._scopes[scope]
+                self._size -= len(oldest.turns)
+            else:
+                oldest.drop_oldest(1)
+                self._size -= 1
+        SEMANTIC_CACHE_ENTRIES.set(self._size)
+
+
+def _plain_text(input_message: Sequence[HumanMessage]) -> Optional[str]:
+    """The text of a single text-only user message, or None."""
+    if len(input_message) != 1:
+        return None
+    content = input_message[0].content
+    if isinstance(content, str):
+        text = content
+    else:
+        parts = []
+        for item in content:
+            if isinstance(item, str):
+                parts.append(item)
+            elif isinstance(item, dict) and item.get("type") == "text":
+                parts.append(item.get("text", ""))
+            else:
+                return None
+        text = "\n".join(parts)
+    text = " ".join(text.split())
+    return text or None
+
+
+def _cacheable_turn(messages: Sequence[BaseMessage], uncacheable_tools: set) -> bool:
+    """Whether a first turn ended normally without time-dependent tools."""
+    if len(messages) < 2 or not isinstance(messages[0], HumanMessage):
+        return False
+    last = messages[-1]
+    if not isinstance(last, AIMessage) or last.tool_calls:
+        return False
+    if last.response_metadata.get("finish_reason") == "client_disconnected":
+        return False
+    for message in messages[1:]:
+        if isinstance(message, HumanMessage):
+            return False
+        if isinstance(message, ToolMessage) and (
+            message.status == "error" or message.name in uncacheable_tools
+        ):
+            return False
+    return True
+
+
+semantic_cache = SemanticCache()
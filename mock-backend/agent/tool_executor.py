@@ -0,0 +1,122 @@
+"""Concurrent execution of the tool calls in a model response."""
+
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import BaseTool
+from langgraph.errors import GraphBubbleUp
+from langgraph.prebuilt.tool_node import (
+    INVALID_TOOL_NAME_ERROR_TEMPLATE,
+    TOOL_CALL_ERROR_TEMPLATE,
+)
+
+from lib.metrics import Histogram
+
+from .config import get_agent_config, get_float_config_value
+
+_config = get_agent_config()
+# Applies to every tool without its own entry under tools.execution.timeouts
+TOOL_TIMEOUT_SECONDS = get_float_config_value(
+    _config, "tools.execution.timeout_seconds", 60.0
+)
+
+TOOL_CALL_DURATION = Histogram(
+    "agent_tool_call_duration_seconds",
+    "Time spent running a single tool call",
+    ["tool", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+TOOL_PHASE_DURATION = Histogram(
+    "agent_tool_phase_duration_seconds",
+    "Time spent running all tool calls of one model response",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+
+
+def tool_timeout(name: str) -> float:
+    """Timeout for one call of the tool ``name``, in seconds."""
+    return get_float_config_value(
+        _config, f"tools.execution.timeouts.{name}", TOOL_TIMEOUT_SECONDS
+    )
+
+
+class ToolExecutor:
+    """Graph node that runs the tool calls of the last AI message.
+
+    Replaces ``ToolNode``: every call runs through the tool's async
+    implementation and all calls run concurrently, so the tool phase takes
+    as long as the slowest tool instead of the sum of all of them. Each call
+    is bounded by its own timeout; a call that fails or times out is
+    answered with an error ``ToolMessage`` so the model can recover, and the
+    other calls are unaffected. Tools without an async implementation are
+    run in a worker thread by LangChain; their thread is abandoned (not
+    killed) on timeout.
+    """
+
+    def __init__(self, tools: List[BaseTool]):
+        self.tools_by_name = {t.name: t for t in tools}
+
+    async def run(self, state: Dict[str, Any], config=None) -> Dict[str, Any]:
+        tool_calls = getattr(state["messages"][-1], "tool_calls", None) or []
+        started = time.monotonic()
+        messages = await asyncio.gather(
+            *(self._run_one(tool_call, config) for tool_call in tool_calls)
+        )
+        TOOL_PHASE_DURATION.observe(time.monotonic() - started)
+        return {"messages": list(messages)}
+
+    async def _run_one(self, tool_call: Dict[str, Any], config) -> ToolMessage:
+        name = tool_call["name"]
+        tool = self.tools_by_name.get(name)
+        if tool is None:
+            return ToolMessage(
+                content=INVALID_TOOL_NAME_ERROR_TEMPLATE.format(
+                    requested_tool=name,
+                    available_tools=", ".join(self.tools_by_name),
+                ),
+                name=name,
+                tool_call_id=tool_call["id"],
+                status="error",
+            )
+
+        timeout = tool_timeout(name)
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                tool.ainvoke({**tool_call, "type": "tool_call"}, config), timeout
+            )
+        except GraphBubbleUp:
+            raise
+        except asyncio.TimeoutError:
+            TOOL_CALL_DURATION.observe(
+                time.monotonic() - started, tool=name, outcome="timeout"
+            )
+            print(f"  ⏱️ Tool {name} timed out after {timeout:g}s")
+            return ToolMessage(
+                content=TOOL_CALL_ERROR_TEMPLATE.format(
+                    error=f"{name} did not finish within {timeout:g} seconds"
+                ),
+                name=name,
+                tool_call_id=tool_call["id"],
+                status="error",
+            )
+        except Exception as e:
+            TOOL_CALL_DURATION.observe(
+                time.monotonic() - started, tool=name, outcome="error"
+            )
+            print(f"  ❌ Tool {name} failed: {e}")
+            return ToolMessage(
+                content=TOOL_CALL_ERROR_TEMPLATE.format(error=repr(e)),
+                name=name,
+                tool_call_id=tool_call["id"],
+                status="error",
+            )
+
+        TOOL_CALL_DURATION.observe(
+            time.monotonic() - started, tool=name, outcome="success"
+        )
+        if isinstance(response, ToolMessage):
+            return response
+        return ToolMessage(content=str(response), name=name, tool_call_id=tool_call["id"])
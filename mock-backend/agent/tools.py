@@ -11,26 +11,36 @@ This module provides various tools that can be used by the LangGraph agent:
    - azure_search_filter: Search with OData filters
    - azure_search_vector: Vector similarity search (requires OpenAI-compatible embeddings)
 
+Tools that do network I/O have both a sync and an async implementation. The
+graph runs the async one, so several tool calls from one model response can
+run concurrently on the event loop (see ``agent/tool_executor.py``).
+
 """
 
 import base64
 import os
+import traceback
 import uuid
 from datetime import datetime
-from typing import Any, Literal, Optional, cast
+from typing import Any, Dict, List, Literal, Tuple, cast
 
+import httpx
 import requests
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from azure.search.documents.models import VectorizedQuery
 from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
 from dotenv import load_dotenv
 from langchain_azure_dynamic_sessions import SessionsPythonREPLTool
 from langchain_community.utilities import SearxSearchWrapper
-from langchain_core.tools import tool
-from openai import OpenAI
+from langchain_core.tools import StructuredTool, tool
+from openai import AsyncOpenAI, OpenAI
 from pydantic import BaseModel, Field
 
+from lib.tool_cache import tool_cache
+
 from .config import (
     get_agent_config,
     get_bool_config_value,
@@ -62,6 +72,14 @@ def _decode_base64_image(data: Any, source: str) -> bytes:
     return base64.b64decode(data)
 
 
+def _tool_error(message: str, error: Exception) -> str:
+    """Log a tool failure and return it as the tool result for the model."""
+    error_msg = f"{message}: {str(error)}"
+    print(f"  ❌ {error_msg}")
+    print(traceback.format_exc())
+    return error_msg
+
+
 ImageSize = Literal[
     "1024x1024",
     "1536x1024",
@@ -116,12 +134,39 @@ def get_dalle_client():
     return OpenAI(base_url=base_url, api_key=api_key)
 
 
+def get_async_dalle_client():
+    base_url = _tool_str("tools.generate_image.dalle.base_url")
+    api_key = _tool_str("tools.generate_image.dalle.api_key")
+    return AsyncOpenAI(base_url=base_url, api_key=api_key)
+
+
 def get_blob_service_client():
     connection_string = _tool_str("tools.generate_image.storage.connection_string")
     assert isinstance(connection_string, str)
     return BlobServiceClient.from_connection_string(connection_string)
 
 
+def get_async_blob_service_client():
+    connection_string = _tool_str("tools.generate_image.storage.connection_string")
+    return AsyncBlobServiceClient.from_connection_string(connection_string)
+
+
+# Async clients that live as long as the process; closed on shutdown
+_async_clients: List[Any] = []
+
+
+async def aclose_tool_clients():
+    """Close the async tool clients. Called from the FastAPI shutdown hook."""
+    for client in _async_clients:
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"  ⚠️ Failed to close tool client: {e}")
+    if _async_clients:
+        print("🔌 Tool clients closed")
+    _async_clients.clear()
+
+
 @tool
 def get_current_time() -> str:
     """Get the current date and time.
@@ -144,6 +189,28 @@ if _tool_enabled("tools.azure_session_pool.enabled"):
     )
     tool_generator.append(code_tool)
 
+
+def _format_web_results(query: str, results: List[Dict[str, Any]]) -> str:
+    if not results:
+        print(f"  ⚠️ No results returned from SearxNG")
+        return f"No web search results found for query: '{query}'"
+
+    print(f"  ✅ Found {len(results)} results")
+
+    final_results = f"Found {len(results)} web search results for '{query}':\n\n"
+    for i, result in enumerate(results, 1):
+        title = result.get("title", "No title")
+        link = result.get("link", "No link")
+        snippet = result.get("snippet", "No snippet")
+
+        final_results += f"## Result {i}: {title}\n"
+        final_results += f"**URL**: {link}\n"
+        final_results += f"{snippet}\n\n"
+        final_results += "---\n\n"
+
+    return final_results
+
+
 if _tool_enabled("tools.searxng.enabled"):
     searxng_url = _tool_str("tools.searxng.base_url")
     assert isinstance(searxng_url, str)
@@ -152,8 +219,16 @@ if _tool_enabled("tools.searxng.enabled"):
     try:
         search = SearxSearchWrapper(searx_host=searxng_url)
 
-        @tool(args_schema=WebSearchInput)
-        def web_search(query: str) -> str:
+        @tool_cache.cached("web_search")
+        def _search_web(query: str) -> str:
+            return _format_web_results(query, search.results(query, num_results=5))
+
+        @tool_cache.cached("web_search")
+        async def _asearch_web(query: str) -> str:
+            results = await search.aresults(query, num_results=5)
+            return _format_web_results(query, results)
+
+        def _web_search(query: str) -> str:
             """Perform a web search using SearxNG to find information on the internet.
 
             Use this tool when you need to search for current information, news, articles,
@@ -167,52 +242,172 @@ if _tool_enabled("tools.searxng.enabled"):
             """
             try:
                 print(f"🔍 Web search: query='{query}', num_results=5")
+                return _search_web(query)
+            except Exception as e:
+                return _tool_error("Error performing web search", e)
 
-                results = search.results(
-                    query,
-                    num_results=5,
-                )
-
-                if not results:
-                    print(f"  ⚠️ No results returned from SearxNG")
-                    return f"No web search results found for query: '{query}'"
-
-                print(f"  ✅ Found {len(results)} results")
-
-                final_results = (
-                    f"Found {len(results)} web search results for '{query}':\n\n"
-                )
-                for i, result in enumerate(results, 1):
-                    title = result.get("title", "No title")
-                    link = result.get("link", "No link")
-                    snippet = result.get("snippet", "No snippet")
-
-                    final_results += f"## Result {i}: {title}\n"
-                    final_results += f"**URL**: {link}\n"
-                    final_results += f"{snippet}\n\n"
-                    final_results += "---\n\n"
-
-                return final_results
-
+        async def _aweb_search(query: str) -> str:
+            try:
+                print(f"🔍 Web search: query='{query}', num_results=5")
+                return await _asearch_web(query)
             except Exception as e:
-                error_msg = f"Error performing web search: {str(e)}"
-                print(f"  ❌ {error_msg}")
-                import traceback
+                return _tool_error("Error performing web search", e)
 
-                print(traceback.format_exc())
-                return error_msg
+        web_search = StructuredTool.from_function(
+            func=_web_search,
+            coroutine=_aweb_search,
+            name="web_search",
+            args_schema=WebSearchInput,
+        )
 
         tool_generator.append(web_search)
         print(f"  ✅ web_search tool loaded successfully")
 
     except Exception as e:
         print(f"  ❌ Failed to initialize SearxNG: {str(e)}")
-        import traceback
-
         print(traceback.format_exc())
 else:
     print("  ⚠️ tools.searxng is disabled, web_search tool will not be available")
 
+
+def _result_metadata(result: Dict[str, Any], exclude: List[str]) -> Dict[str, Any]:
+    return {
+        k: v for k, v in result.items() if not k.startswith("@") and k not in exclude
+    }
+
+
+def _format_document_results(
+    query: str, semantic_config: str, results: List[Dict[str, Any]]
+) -> str:
+    formatted_results = []
+    result_count = 0
+    for result in results:
+        result_count += 1
+        score = getattr(result, "@search.score", "N/A")
+        print(f"  📄 Result {result_count}: score={score}")
+
+        # Get semantic captions if available
+        captions = getattr(result, "@search.captions", [])
+        caption_text = (
+            captions[0].text if captions else result.get("content", "No content")[:300]
+        )
+
+        formatted_results.append(
+            {
+                "score": score,
+                "caption": caption_text,
+                "content": result.get("content", "No content"),
+                "metadata": _result_metadata(result, ["content"]),
+            }
+        )
+
+    print(f"  ✅ Total results found: {result_count}")
+
+    if not formatted_results:
+        return f"No semantic results found for query: '{query}'\n\nℹ️ Possible reasons:\n- Semantic configuration '{semantic_config}' doesn't exist in index\n- Query doesn't match any documents\n- Try using regular text search instead"
+
+    # Format results as readable text
+    output = f"Found {len(formatted_results)} semantic results for '{query}':\n\n"
+    for i, result in enumerate(formatted_results, 1):
+        filename = result["metadata"].get("filename", "Unknown")
+        chunk_index = result["metadata"].get("chunk_index", 0)
+        id_ = result["metadata"].get("id", "Unknown")
+        content = result["content"]
+        score = result["score"]
+
+        output += f"## Result {i} (Score: {score})\n"
+        output += (
+            f"**File**: {filename} | **Chunk**: {chunk_index} | **ID**: `{id_}`\n\n"
+        )
+        output += f"{content}\n\n"
+        output += "---\n\n"
+
+    return output
+
+
+def _format_filter_results(
+    query: str, filter_expression: str, results: List[Dict[str, Any]]
+) -> str:
+    formatted_results = []
+    result_count = 0
+    for result in results:
+        result_count += 1
+        print(
+            f"  📄 Result {result_count}: score={getattr(result, '@search.score', 'N/A')}"
+        )
+
+        formatted_results.append(
+            {
+                "score": getattr(result, "@search.score", "N/A"),
+                "content": result.get("content", "No content"),
+                "metadata": _result_metadata(result, ["content"]),
+            }
+        )
+
+    print(f"  ✅ Total results found: {result_count}")
+
+    if not formatted_results:
+        return f"No results found for query: '{query}' with filter: '{filter_expression}'"
+
+    # Format results as readable text
+    output = f"Found {len(formatted_results)} filtered results for '{query}' (Filter: {filter_expression}):\n\n"
+    for i, result in enumerate(formatted_results, 1):
+        filename = result["metadata"].get("filename", "Unknown")
+        chunk_index = result["metadata"].get("chunk_index", 0)
+        id_ = result["metadata"].get("id", "Unknown")
+        content = result["content"]
+        score = result["score"]
+
+        output += f"## Result {i} (Score: {score:.4f})\n"
+        output += (
+            f"**File**: {filename} | **Chunk**: {chunk_index} | **ID**: `{id_}`\n\n"
+        )
+        output += f"{content}\n\n"
+        output += "---\n\n"
+
+    return output
+
+
+def _format_vector_results(
+    query: str, vector_field: str, results: List[Dict[str, Any]]
+) -> str:
+    formatted_results = []
+    result_count = 0
+    for result in results:
+        result_count += 1
+        print(f"  📄 Result {result_count}: {list(result.keys())}")
+
+        formatted_results.append(
+            {
+                "title": result.get("title", "No title"),
+                "content": result.get("content", "No content"),
+                "metadata": _result_metadata(
+                    result, ["title", "content", vector_field]
+                ),
+            }
+        )
+
+    print(f"  ✅ Total results found: {result_count}")
+
+    if not formatted_results:
+        return f"No vector results found for query: '{query}'\n\nℹ️ Possible reasons:\n- Index is empty\n- Vector field '{vector_field}' doesn't exist\n- No documents have embeddings\n- Embedding dimension mismatch"
+
+    # Format results as readable text
+    output = f"Found {len(formatted_results)} vector similarity results for '{query}':\n\n"
+    for result in formatted_results:
+        filename = result["metadata"].get("filename", "Unknown")
+        chunk_index = result["metadata"].get("chunk_index", 0)
+        id_ = result["metadata"].get("id", "Unknown")
+        content = result["content"]
+        output += f"# File: {filename} Chunk [{chunk_index}]\n"
+        output += f"**chunk_id/id**: {id_}\n"
+        output += "Content:\n```\n"
+        output += f"{content}\n"
+        output += "```\n\n"
+
+    return output
+
+
 # Azure AI Search tools
 if _tool_enabled("tools.ai_search.enabled"):
     search_endpoint = _tool_str("tools.ai_search.endpoint")
@@ -226,9 +421,50 @@ if _tool_enabled("tools.ai_search.enabled"):
         index_name=search_index_name,
         credential=AzureKeyCredential(search_api_key),
     )
+    async_search_client = AsyncSearchClient(
+        endpoint=search_endpoint,
+        index_name=search_index_name,
+        credential=AzureKeyCredential(search_api_key),
+    )
+    _async_clients.append(async_search_client)
 
-    @tool(args_schema=AzureSearchInput)
-    def document_search(query: str, top: int = 5) -> str:
+    def _document_search_params(query: str, top: int) -> Dict[str, Any]:
+        # Get semantic configuration from config or use default
+        semantic_config = _tool_value(
+            "tools.ai_search.semantic_config", "main-semantic-config"
+        )
+        print(
+            f"🔍 Semantic search: query='{query}', top={top}, config='{semantic_config}'"
+        )
+        return {
+            "search_text": query,
+            "top": top,
+            "query_type": "semantic",
+            "semantic_configuration_name": semantic_config,
+            "query_caption": "extractive",
+            "query_answer": "extractive",
+            "include_total_count": True,
+        }
+
+    @tool_cache.cached("document_search")
+    def _run_document_search(query: str, top: int) -> str:
+        params = _document_search_params(query, top)
+        results = list(search_client.search(**params))
+        return _format_document_results(
+            query, params["semantic_configuration_name"], results
+        )
+
+    @tool_cache.cached("document_search")
+    async def _arun_document_search(query: str, top: int) -> str:
+        params = _document_search_params(query, top)
+        results = [
+            result async for result in await async_search_client.search(**params)
+        ]
+        return _format_document_results(
+            query, params["semantic_configuration_name"], results
+        )
+
+    def _document_search(query: str, top: int = 5) -> str:
         """Search documents in Azure AI Search using semantic search capabilities.
 
         Args:
@@ -240,87 +476,51 @@ if _tool_enabled("tools.ai_search.enabled"):
         """
         try:
             top = min(max(1, top), 50)  # Ensure top is between 1 and 50
+            return _run_document_search(query, top)
+        except Exception as e:
+            return _tool_error("Error performing semantic search", e)
 
-            # Get semantic configuration from config or use default
-            semantic_config = _tool_value(
-                "tools.ai_search.semantic_config", "main-semantic-config"
-            )
-            print(
-                f"🔍 Semantic search: query='{query}', top={top}, config='{semantic_config}'"
-            )
+    async def _adocument_search(query: str, top: int = 5) -> str:
+        try:
+            top = min(max(1, top), 50)  # Ensure top is between 1 and 50
+            return await _arun_document_search(query, top)
+        except Exception as e:
+            return _tool_error("Error performing semantic search", e)
+
+    document_search = StructuredTool.from_function(
+        func=_document_search,
+        coroutine=_adocument_search,
+        name="document_search",
+        args_schema=AzureSearchInput,
+    )
+    tool_generator.append(document_search)
 
-            results = search_client.search(
+    @tool_cache.cached("azure_search_filter")
+    def _run_filter_search(query: str, filter_expression: str, top: int) -> str:
+        results = list(
+            search_client.search(
                 search_text=query,
+                filter=filter_expression,
                 top=top,
-                query_type="semantic",
-                semantic_configuration_name=semantic_config,
-                query_caption="extractive",
-                query_answer="extractive",
                 include_total_count=True,
             )
+        )
+        return _format_filter_results(query, filter_expression, results)
 
-            formatted_results = []
-            result_count = 0
-            for result in results:
-                result_count += 1
-                score = getattr(result, "@search.score", "N/A")
-                print(f"  📄 Result {result_count}: score={score}")
-
-                # Get semantic captions if available
-                captions = getattr(result, "@search.captions", [])
-                caption_text = (
-                    captions[0].text
-                    if captions
-                    else result.get("content", "No content")[:300]
-                )
-
-                formatted_result = {
-                    "score": score,
-                    "caption": caption_text,
-                    "content": result.get("content", "No content"),
-                    "metadata": {
-                        k: v
-                        for k, v in result.items()
-                        if not k.startswith("@") and k not in ["content"]
-                    },
-                }
-                formatted_results.append(formatted_result)
-
-            print(f"  ✅ Total results found: {result_count}")
-
-            if not formatted_results:
-                return f"No semantic results found for query: '{query}'\n\nℹ️ Possible reasons:\n- Semantic configuration '{semantic_config}' doesn't exist in index\n- Query doesn't match any documents\n- Try using regular text search instead"
-
-            # Format results as readable text
-            output = (
-                f"Found {len(formatted_results)} semantic results for '{query}':\n\n"
+    @tool_cache.cached("azure_search_filter")
+    async def _arun_filter_search(query: str, filter_expression: str, top: int) -> str:
+        results = [
+            result
+            async for result in await async_search_client.search(
+                search_text=query,
+                filter=filter_expression,
+                top=top,
+                include_total_count=True,
             )
-            for i, result in enumerate(formatted_results, 1):
-                filename = result["metadata"].get("filename", "Unknown")
-                chunk_index = result["metadata"].get("chunk_index", 0)
-                id_ = result["metadata"].get("id", "Unknown")
-                content = result["content"]
-                score = result["score"]
-
-                output += f"## Result {i} (Score: {score})\n"
-                output += f"**File**: {filename} | **Chunk**: {chunk_index} | **ID**: `{id_}`\n\n"
-                output += f"{content}\n\n"
-                output += "---\n\n"
-
-            return output
+        ]
+        return _format_filter_results(query, filter_expression, results)
 
-        except Exception as e:
-            error_msg = f"Error performing semantic search: {str(e)}"
-            print(f"  ❌ {error_msg}")
-            import traceback
-
-            print(traceback.format_exc())
-            return error_msg
-
-    tool_generator.append(document_search)
-
-    @tool(args_schema=AzureSearchFilterInput)
-    def azure_search_filter(query: str, filter_expression: str, top: int = 5) -> str:
+    def _azure_search_filter(query: str, filter_expression: str, top: int = 5) -> str:
         """Search documents in Azure AI Search with OData filter expressions.
 
         Args:
@@ -336,62 +536,28 @@ if _tool_enabled("tools.ai_search.enabled"):
             print(
                 f"🔍 Filtered search: query='{query}', filter='{filter_expression}', top={top}"
             )
+            return _run_filter_search(query, filter_expression, top)
+        except Exception as e:
+            return _tool_error("Error performing filtered search", e)
 
-            results = search_client.search(
-                search_text=query,
-                filter=filter_expression,
-                top=top,
-                include_total_count=True,
+    async def _aazure_search_filter(
+        query: str, filter_expression: str, top: int = 5
+    ) -> str:
+        try:
+            top = min(max(1, top), 50)  # Ensure top is between 1 and 50
+            print(
+                f"🔍 Filtered search: query='{query}', filter='{filter_expression}', top={top}"
             )
-
-            formatted_results = []
-            result_count = 0
-            for result in results:
-                result_count += 1
-                print(
-                    f"  📄 Result {result_count}: score={getattr(result, '@search.score', 'N/A')}"
-                )
-
-                formatted_result = {
-                    "score": getattr(result, "@search.score", "N/A"),
-                    "content": result.get("content", "No content"),
-                    "metadata": {
-                        k: v
-                        for k, v in result.items()
-                        if not k.startswith("@") and k not in ["content"]
-                    },
-                }
-                formatted_results.append(formatted_result)
-
-            print(f"  ✅ Total results found: {result_count}")
-
-            if not formatted_results:
-                return f"No results found for query: '{query}' with filter: '{filter_expression}'"
-
-            # Format results as readable text
-            output = f"Found {len(formatted_results)} filtered results for '{query}' (Filter: {filter_expression}):\n\n"
-            for i, result in enumerate(formatted_results, 1):
-                filename = result["metadata"].get("filename", "Unknown")
-                chunk_index = result["metadata"].get("chunk_index", 0)
-                id_ = result["metadata"].get("id", "Unknown")
-                content = result["content"]
-                score = result["score"]
-
-                output += f"## Result {i} (Score: {score:.4f})\n"
-                output += f"**File**: {filename} | **Chunk**: {chunk_index} | **ID**: `{id_}`\n\n"
-                output += f"{content}\n\n"
-                output += "---\n\n"
-
-            return output
-
+            return await _arun_filter_search(query, filter_expression, top)
         except Exception as e:
-            error_msg = f"Error performing filtered search: {str(e)}"
-            print(f"  ❌ {error_msg}")
-            import traceback
-
-            print(traceback.format_exc())
-            return error_msg
+            return _tool_error("Error performing filtered search", e)
 
+    azure_search_filter = StructuredTool.from_function(
+        func=_azure_search_filter,
+        coroutine=_aazure_search_filter,
+        name="azure_search_filter",
+        args_schema=AzureSearchFilterInput,
+    )
     tool_generator.append(azure_search_filter)
 
     # Vector search tool (requires vector embeddings)
@@ -405,9 +571,71 @@ if _tool_enabled("tools.ai_search.enabled"):
                 base_url=embedding_base_url,
                 api_key=embedding_api_key,
             )
+            async_openai_client = AsyncOpenAI(
+                base_url=embedding_base_url,
+                api_key=embedding_api_key,
+            )
+            _async_clients.append(async_openai_client)
 
-            @tool(args_schema=AzureSearchInput)
-            def azure_search_vector(query: str, top: int = 5) -> str:
+            def _vector_search_params(
+                query: str, top: int, query_vector: List[float]
+            ) -> Tuple[str, Dict[str, Any]]:
+                print(f"  ✅ Generated embedding vector (dim={len(query_vector)})")
+
+                # Perform vector search
+                vector_field = cast(
+                    str,
+                    _tool_value("tools.ai_search.vector_field", "content_vector"),
+                )
+                print(f"  🔍 Searching vector field: '{vector_field}'")
+
+                vector_query = VectorizedQuery(
+                    vector=query_vector,
+                    k_nearest_neighbors=top,
+                    fields=vector_field,
+                )
+                return vector_field, {
+                    "search_text": None,
+                    "vector_queries": [vector_query],
+                    "top": top,
+                }
+
+            def _embedding_model(query: str, top: int) -> str:
+                embedding_model = _tool_str("tools.ai_search.openai_embedding.model_id")
+                assert isinstance(embedding_model, str)
+                print(
+                    f"🔍 Vector search: query='{query}', top={top}, embedding_model='{embedding_model}'"
+                )
+                return embedding_model
+
+            @tool_cache.cached("azure_search_vector")
+            def _run_vector_search(query: str, top: int) -> str:
+                # Generate embedding for the query
+                response = openai_client.embeddings.create(
+                    input=query, model=_embedding_model(query, top)
+                )
+                vector_field, params = _vector_search_params(
+                    query, top, response.data[0].embedding
+                )
+                results = list(search_client.search(**params))
+                return _format_vector_results(query, vector_field, results)
+
+            @tool_cache.cached("azure_search_vector")
+            async def _arun_vector_search(query: str, top: int) -> str:
+                # Generate embedding for the query
+                response = await async_openai_client.embeddings.create(
+                    input=query, model=_embedding_model(query, top)
+                )
+                vector_field, params = _vector_search_params(
+                    query, top, response.data[0].embedding
+                )
+                results = [
+                    result
+                    async for result in await async_search_client.search(**params)
+                ]
+                return _format_vector_results(query, vector_field, results)
+
+            def _azure_search_vector(query: str, top: int = 5) -> str:
                 """Search documents in Azure AI Search using vector similarity.
 
                 Args:
@@ -419,101 +647,41 @@ if _tool_enabled("tools.ai_search.enabled"):
                 """
                 try:
                     top = min(max(1, top), 50)  # Ensure top is between 1 and 50
-
-                    # Generate embedding for the query
-                    embedding_model = _tool_str(
-                        "tools.ai_search.openai_embedding.model_id"
-                    )
-                    assert isinstance(embedding_model, str)
-                    print(
-                        f"🔍 Vector search: query='{query}', top={top}, embedding_model='{embedding_model}'"
-                    )
-
-                    response = openai_client.embeddings.create(
-                        input=query, model=embedding_model
-                    )
-                    query_vector = response.data[0].embedding
-                    print(f"  ✅ Generated embedding vector (dim={len(query_vector)})")
-
-                    # Perform vector search
-                    vector_field = cast(
-                        str,
-                        _tool_value("tools.ai_search.vector_field", "content_vector"),
-                    )
-                    print(f"  🔍 Searching vector field: '{vector_field}'")
-
-                    vector_query = VectorizedQuery(
-                        vector=query_vector,
-                        k_nearest_neighbors=top,
-                        fields=vector_field,
-                    )
-
-                    results = search_client.search(
-                        search_text=None, vector_queries=[vector_query], top=top
-                    )
-
-                    formatted_results = []
-                    result_count = 0
-                    for result in results:
-                        result_count += 1
-                        print(f"  📄 Result {result_count}: {list(result.keys())}")
-
-                        formatted_result = {
-                            "title": result.get("title", "No title"),
-                            "content": result.get("content", "No content"),
-                            "metadata": {
-                                k: v
-                                for k, v in result.items()
-                                if not k.startswith("@")
-                                and k not in ["title", "content", vector_field]
-                            },
-                        }
-                        formatted_results.append(formatted_result)
-
-                    print(f"  ✅ Total results found: {result_count}")
-
-                    if not formatted_results:
-                        return f"No vector results found for query: '{query}'\n\nℹ️ Possible reasons:\n- Index is empty\n- Vector field '{vector_field}' doesn't exist\n- No documents have embeddings\n- Embedding dimension mismatch"
-
-                    # Format results as readable text
-                    output = f"Found {len(formatted_results)} vector similarity results for '{query}':\n\n"
-                    for result in formatted_results:
-                        filename = result["metadata"].get("filename", "Unknown")
-                        chunk_index = result["metadata"].get("chunk_index", 0)
-                        id_ = result["metadata"].get("id", "Unknown")
-                        content = result["content"]
-                        output += f"# File: {filename} Chunk [{chunk_index}]\n"
-                        output += f"**chunk_id/id**: {id_}\n"
-                        output += "Content:\n```\n"
-                        output += f"{content}\n"
-                        output += "```\n\n"
-
-                    return output
-
+                    return _run_vector_search(query, top)
                 except Exception as e:
-                    error_msg = f"Error performing vector search: {str(e)}"
-                    print(f"  ❌ {error_msg}")
-                    import traceback
+                    return _tool_error("Error performing vector search", e)
 
-                    print(traceback.format_exc())
-                    return error_msg
+            async def _aazure_search_vector(query: str, top: int = 5) -> str:
+                try:
+                    top = min(max(1, top), 50)  # Ensure top is between 1 and 50
+                    return await _arun_vector_search(query, top)
+                except Exception as e:
+                    return _tool_error("Error performing vector search", e)
 
+            azure_search_vector = StructuredTool.from_function(
+                func=_azure_search_vector,
+                coroutine=_aazure_search_vector,
+                name="azure_search_vector",
+                args_schema=AzureSearchInput,
+            )
             tool_generator.append(azure_search_vector)
 
         except ImportError:
             pass  # OpenAI client not available
 
 
-def _generate_image_flux(prompt: str, size: str) -> bytes:
-    """Generate an image using FLUX model via Azure AI Foundry.
+def _image_bytes_from_response(result: Dict[str, Any], model_name: str) -> bytes:
+    data = result.get("data")
+    if not isinstance(data, list) or not data:
+        raise ValueError(f"{model_name} response did not include image data")
+    first_item = data[0]
+    if not isinstance(first_item, dict):
+        raise ValueError(f"{model_name} response contained invalid image payload")
+    return _decode_base64_image(first_item.get("b64_json"), f"{model_name} response")
 
-    Args:
-        prompt: Prompt for image generation
-        size: Size of the generated image
 
-    Returns:
-        bytes: Generated image bytes
-    """
+def _flux_request(prompt: str, size: str) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """Build the FLUX request as (url, headers, payload)."""
     flux_endpoint = _tool_str("tools.generate_image.flux.endpoint")
     api_key = _tool_str("tools.generate_image.flux.api_key")
     model_id = _tool_str("tools.generate_image.flux.model_id")
@@ -540,17 +708,89 @@ def _generate_image_flux(prompt: str, size: str) -> bytes:
     }
 
     print(f"  🌐 Calling FLUX API: {url}")
+    return url, headers, payload
+
+
+def _gpt_image_request(
+    prompt: str, size: str
+) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """Build the GPT-Image request as (url, headers, payload)."""
+    gpt_image_endpoint = _tool_str("tools.generate_image.gpt_image.endpoint")
+    api_key = _tool_str("tools.generate_image.gpt_image.api_key")
+    api_version = cast(
+        str, _tool_value("tools.generate_image.gpt_image.api_version", "2024-02-01")
+    )
+    model_id = _tool_str("tools.generate_image.gpt_image.model_id")
+    assert isinstance(gpt_image_endpoint, str)
+    assert isinstance(api_key, str)
+    assert isinstance(api_version, str)
+    assert isinstance(model_id, str)
+
+    url = f"{gpt_image_endpoint.rstrip('/')}?api-version={api_version}"
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    payload = {
+        "prompt": prompt,
+        "size": size,
+        "quality": "medium",
+        "output_compression": 100,
+        "output_format": "png",
+        "model": model_id,
+        "n": 1,
+    }
+
+    print(f"  🌐 Calling GPT-Image API: {url}")
+    return url, headers, payload
+
+
+def _dalle_request(prompt: str, size: str, style: str) -> Dict[str, Any]:
+    model_id = _tool_str("tools.generate_image.dalle.model_id")
+    assert isinstance(model_id, str)
+    return {
+        "model": model_id,
+        "prompt": prompt,
+        "size": cast(Any, size),
+        "quality": "standard",
+        "style": cast(Any, style),
+        "n": 1,
+        "response_format": "b64_json",
+    }
+
+
+def _dalle_image_bytes(result: Any) -> bytes:
+    if not result.data:
+        raise ValueError("DALL-E response did not include image data")
+    first_item = cast(Any, result.data[0])
+    b64_data = first_item.b64_json
+    return _decode_base64_image(b64_data, "DALL-E response")
+
+
+def _generate_image_flux(prompt: str, size: str) -> bytes:
+    """Generate an image using FLUX model via Azure AI Foundry.
+
+    Args:
+        prompt: Prompt for image generation
+        size: Size of the generated image
+
+    Returns:
+        bytes: Generated image bytes
+    """
+    url, headers, payload = _flux_request(prompt, size)
     response = requests.post(url, headers=headers, json=payload, timeout=120)
     response.raise_for_status()
+    return _image_bytes_from_response(response.json(), "FLUX")
 
-    result = response.json()
-    data = result.get("data")
-    if not isinstance(data, list) or not data:
-        raise ValueError("FLUX response did not include image data")
-    first_item = data[0]
-    if not isinstance(first_item, dict):
-        raise ValueError("FLUX response contained invalid image payload")
-    return _decode_base64_image(first_item.get("b64_json"), "FLUX response")
+
+async def _agenerate_image_flux(prompt: str, size: str) -> bytes:
+    url, headers, payload = _flux_request(prompt, size)
+    async with httpx.AsyncClient(timeout=120) as client:
+        response = await client.post(url, headers=headers, json=payload)
+    response.raise_for_status()
+    return _image_bytes_from_response(response.json(), "FLUX")
 
 
 def _generate_image_dalle(prompt: str, size: str, style: str) -> bytes:
@@ -565,24 +805,14 @@ def _generate_image_dalle(prompt: str, size: str, style: str) -> bytes:
         bytes: Generated image bytes
     """
     client = get_dalle_client()
-    model_id = _tool_str("tools.generate_image.dalle.model_id")
-    assert isinstance(model_id, str)
+    result = client.images.generate(**_dalle_request(prompt, size, style))
+    return _dalle_image_bytes(result)
 
-    result = client.images.generate(
-        model=model_id,
-        prompt=prompt,
-        size=cast(Any, size),
-        quality="standard",
-        style=cast(Any, style),
-        n=1,
-        response_format="b64_json",
-    )
 
-    if not result.data:
-        raise ValueError("DALL-E response did not include image data")
-    first_item = cast(Any, result.data[0])
-    b64_data = first_item.b64_json
-    return _decode_base64_image(b64_data, "DALL-E response")
+async def _agenerate_image_dalle(prompt: str, size: str, style: str) -> bytes:
+    async with get_async_dalle_client() as client:
+        result = await client.images.generate(**_dalle_request(prompt, size, style))
+    return _dalle_image_bytes(result)
 
 
 def _generate_image_gpt_image(prompt: str, size: str) -> bytes:
@@ -595,50 +825,44 @@ def _generate_image_gpt_image(prompt: str, size: str) -> bytes:
     Returns:
         bytes: Generated image bytes
     """
-    gpt_image_endpoint = _tool_str("tools.generate_image.gpt_image.endpoint")
-    api_key = _tool_str("tools.generate_image.gpt_image.api_key")
-    api_version = cast(
-        str, _tool_value("tools.generate_image.gpt_image.api_version", "2024-02-01")
-    )
-    model_id = _tool_str("tools.generate_image.gpt_image.model_id")
-    assert isinstance(gpt_image_endpoint, str)
-    assert isinstance(api_key, str)
-    assert isinstance(api_version, str)
-    assert isinstance(model_id, str)
-
-    url = f"{gpt_image_endpoint.rstrip('/')}?api-version={api_version}"
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
+    url, headers, payload = _gpt_image_request(prompt, size)
+    response = requests.post(url, headers=headers, json=payload, timeout=120)
+    response.raise_for_status()
+    return _image_bytes_from_response(response.json(), "GPT-Image")
 
-    payload = {
-        "prompt": prompt,
-        "size": size,
-        "quality": "medium",
-        "output_compression": 100,
-        "output_format": "png",
-        "model": model_id,
-        "n": 1,
-    }
 
-    print(f"  🌐 Calling GPT-Image API: {url}")
-    response = requests.post(url, headers=headers, json=payload, timeout=120)
+async def _agenerate_image_gpt_image(prompt: str, size: str) -> bytes:
+    url, headers, payload = _gpt_image_request(prompt, size)
+    async with httpx.AsyncClient(timeout=120) as client:
+        response = await client.post(url, headers=headers, json=payload)
     response.raise_for_status()
+    return _image_bytes_from_response(response.json(), "GPT-Image")
 
-    result = response.json()
-    data = result.get("data")
-    if not isinstance(data, list) or not data:
-        raise ValueError("GPT-Image response did not include image data")
-    first_item = data[0]
-    if not isinstance(first_item, dict):
-        raise ValueError("GPT-Image response contained invalid image payload")
-    return _decode_base64_image(first_item.get("b64_json"), "GPT-Image response")
 
+def _image_provider(prompt: str) -> Tuple[str, str]:
+    """Validate the image generation config and return (provider, container)."""
+    storage_connection_string = _tool_str(
+        "tools.generate_image.storage.connection_string"
+    )
+    container_name = _tool_str("tools.generate_image.storage.container_name")
+    provider = _tool_str("tools.generate_image.provider").lower()
+    assert isinstance(storage_connection_string, str)
+    assert isinstance(container_name, str)
+    assert isinstance(provider, str)
+
+    if provider not in {"dalle", "flux", "gpt_image"}:
+        raise EnvironmentError("Invalid tools.generate_image.provider value")
+
+    model_name = (
+        "GPT-Image"
+        if provider == "gpt_image"
+        else ("FLUX" if provider == "flux" else "DALL-E")
+    )
+    print(f"🔍 Image generation: prompt='{prompt}', model='{model_name}'")
+    return provider, container_name
 
-@tool
-def generate_image(
+
+def _generate_image(
     prompt: str,
     size: ImageSize = "1024x1024",
     style: ImageStyle = "vivid",
@@ -656,24 +880,7 @@ def generate_image(
         str: Generated image URL
     """
     try:
-        storage_connection_string = _tool_str(
-            "tools.generate_image.storage.connection_string"
-        )
-        container_name = _tool_str("tools.generate_image.storage.container_name")
-        provider = _tool_str("tools.generate_image.provider").lower()
-        assert isinstance(storage_connection_string, str)
-        assert isinstance(container_name, str)
-        assert isinstance(provider, str)
-
-        if provider not in {"dalle", "flux", "gpt_image"}:
-            raise EnvironmentError("Invalid tools.generate_image.provider value")
-
-        model_name = (
-            "GPT-Image"
-            if provider == "gpt_image"
-            else ("FLUX" if provider == "flux" else "DALL-E")
-        )
-        print(f"🔍 Image generation: prompt='{prompt}', model='{model_name}'")
+        provider, container_name = _image_provider(prompt)
 
         # Generate image based on model type
         image_size = cast(str, size)
@@ -709,19 +916,63 @@ def generate_image(
         return image_url
 
     except EnvironmentError as e:
-        error_msg = f"Environment error: {str(e)}"
-        print(f"  ❌ {error_msg}")
-        import traceback
+        return _tool_error("Environment error", e)
+    except Exception as e:
+        return _tool_error("Error generating image", e)
 
-        print(traceback.format_exc())
-        return error_msg
+
+async def _agenerate_image(
+    prompt: str,
+    size: ImageSize = "1024x1024",
+    style: ImageStyle = "vivid",
+) -> str:
+    try:
+        provider, container_name = _image_provider(prompt)
+
+        # Generate image based on model type
+        image_size = cast(str, size)
+        image_style = cast(str, style)
+
+        if provider == "gpt_image":
+            image_bytes = await _agenerate_image_gpt_image(prompt, image_size)
+        elif provider == "flux":
+            image_bytes = await _agenerate_image_flux(prompt, image_size)
+        else:
+            image_bytes = await _agenerate_image_dalle(
+                prompt, image_size, image_style
+            )
+
+        print(f"  ✅ Image generated (size: {len(image_bytes)} bytes)")
+
+        # Upload to Blob Storage
+        blob_name = f"images/{uuid.uuid4()}.png"
+        async with get_async_blob_service_client() as blob_service:
+            blob_client = blob_service.get_blob_client(
+                container=container_name, blob=blob_name
+            )
+            await blob_client.upload_blob(
+                image_bytes,
+                overwrite=True,
+                content_settings=ContentSettings(content_type="image/png"),
+            )
+            print(f"  ✅ Image uploaded to blob: {blob_name}")
+
+            # Return the public URL
+            image_url = blob_client.url
+        print(f"  ✅ Image URL: {image_url}")
+        return image_url
+
+    except EnvironmentError as e:
+        return _tool_error("Environment error", e)
     except Exception as e:
-        error_msg = f"Error generating image: {str(e)}"
-        print(f"  ❌ {error_msg}")
-        import traceback
+        return _tool_error("Error generating image", e)
 
-        print(traceback.format_exc())
-        return error_msg
+
+generate_image = StructuredTool.from_function(
+    func=_generate_image,
+    coroutine=_agenerate_image,
+    name="generate_image",
+)
 
 
 if _tool_enabled("tools.generate_image.enabled"):
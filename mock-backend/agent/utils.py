@@ -1,237 +1,136 @@
 """LangGraph utility functions for message processing."""
 
-from typing import List
+import asyncio
+import logging
+from typing import Dict, List
 
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 
-from lib.blob import get_file_base64, get_file_temporary_link
+from lib.application_config import (
+    get_application_config,
+    get_int_application_config_value,
+)
+from lib.attachment_cache import attachment_cache
+from lib.blob import get_file_base64_async
 from lib.database import db_manager
 
+logger = logging.getLogger(__name__)
 
-def change_file_to_url(messages: List[BaseMessage]) -> List[BaseMessage]:
-    """
-    Convert chatbot://{id} URLs to temporary blob URLs with SAS tokens in all messages.
+# Attachments fetched in parallel when preparing a model call
+ATTACHMENT_RESOLVE_CONCURRENCY = max(
+    get_int_application_config_value(
+        get_application_config(), "attachments.resolve_concurrency", 8
+    ),
+    1,
+)
 
-    This function inspects all messages and looks for image_url content with chatbot:// URLs,
-    then replaces them with temporary blob URLs (valid for 1 hour) before sending to AI.
 
-    Args:
-        messages: List of BaseMessage objects that may contain chatbot:// URLs
+def _attachment_id_from_url(url: str) -> str:
+    return url.replace("chatbot://", "").rstrip("/").strip()
 
-    Returns:
-        List[BaseMessage]: Messages with chatbot:// URLs replaced by blob URLs with SAS tokens
-    """
-    processed_messages = []
 
-    for message in messages:
-        # Create a copy of the message to avoid modifying the original
-        if isinstance(message, HumanMessage):
-            processed_message = process_human_message(message)
-        elif isinstance(message, AIMessage):
-            processed_message = process_ai_message(message)
-        elif isinstance(message, SystemMessage):
-            # System messages typically don't have images
-            processed_message = message
-        else:
-            # For other message types, keep as is
-            processed_message = message
+async def resolve_attachment_data_url(attachment_id: str) -> str | None:
+    """Resolve one attachment to a base64 data URL, using the cache first."""
+    cached = attachment_cache.get(attachment_id)
+    if cached is not None:
+        return cached
 
-        processed_messages.append(processed_message)
+    attachment = await db_manager.get_attachment_async(attachment_id)
+    if not attachment:
+        print(f"Warning: Attachment not found for ID: {attachment_id}")
+        return None
 
-    return processed_messages
+    mime_type, blob_base64 = await get_file_base64_async(attachment.blob_name)
+    data_url = f"data:{mime_type};base64,{blob_base64}"
+    attachment_cache.put(attachment_id, data_url)
+    return data_url
 
 
-def process_human_message(message: HumanMessage) -> HumanMessage:
+async def change_file_to_url_async(
+    messages: List[BaseMessage],
+    max_concurrency: int = ATTACHMENT_RESOLVE_CONCURRENCY,
+) -> List[BaseMessage]:
     """
-    Process HumanMessage to convert chatbot:// URLs to blob URLs.
+    Replace ``chatbot://`` attachment references with their content.
+
+    Every distinct ``chatbot://`` reference in the messages is resolved to a
+    base64 data URL in parallel (at most ``max_concurrency`` downloads at a
+    time), then the messages that reference them are rebuilt. References
+    that fail to resolve are left unchanged.
 
     Args:
-        message: HumanMessage that may contain chatbot:// URLs
+        messages: List of BaseMessage objects that may contain chatbot:// URLs
 
     Returns:
-        HumanMessage: Message with converted URLs
+        List[BaseMessage]: Messages with chatbot:// URLs replaced by data URLs
     """
-    # Check if message has content attribute
-    if not hasattr(message, "content"):
-        return message
-
-    content = message.content
-
-    # If content is a string, no images to process
-    if isinstance(content, str):
-        return message
-
-    # If content is a list (multimodal content)
-    if isinstance(content, list):
-        new_content = []
-
-        for item in content:
-            if isinstance(item, dict):
-                # Check if this is an image_url type
-                if item.get("type") == "image_url":
-                    new_item = process_image_url_item(item)
-                    new_content.append(new_item)
-                else:
-                    # Keep other content types as is (text, etc.)
-                    new_content.append(item)
-            else:
-                new_content.append(item)
-
-        # Create new HumanMessage with updated content
-        return HumanMessage(
-            content=new_content,
-            additional_kwargs=message.additional_kwargs
-            if hasattr(message, "additional_kwargs")
-            else {},
-            id=message.id if hasattr(message, "id") else None,
-        )
-
-    return message
-
-
-def process_ai_message(message: AIMessage) -> AIMessage:
-    """
-    Process AIMessage to convert chatbot:// URLs to blob URLs.
-
-    Note: AI messages typically don't have chatbot:// URLs, but we process them
-    for completeness in case they're present in the content.
+    attachment_ids = {
+        _attachment_id_from_url(f"chatbot://{file_id}")
+        for file_id in extract_file_ids_from_messages(messages)
+    }
+    attachment_ids.discard("")
+    if not attachment_ids:
+        return messages
 
-    Args:
-        message: AIMessage that may contain chatbot:// URLs
+    semaphore = asyncio.Semaphore(max_concurrency)
+    resolved: Dict[str, str] = {}
 
-    Returns:
-        AIMessage: Message with converted URLs
-    """
-    # Check if message has content attribute
-    if not hasattr(message, "content"):
-        return message
+    async def resolve(attachment_id: str):
+        try:
+            async with semaphore:
+                data_url = await resolve_attachment_data_url(attachment_id)
+            if data_url is not None:
+                resolved[attachment_id] = data_url
+        except Exception as e:
+            print(f"Error processing image_url item: {e}")
 
-    content = message.content
+    await asyncio.gather(*(resolve(attachment_id) for attachment_id in attachment_ids))
 
-    # If content is a string, no images to process
-    if isinstance(content, str):
-        return message
+    if not resolved:
+        return messages
 
-    # If content is a list (multimodal content)
-    if isinstance(content, list):
+    def replace(content):
         new_content = []
-
         for item in content:
-            if isinstance(item, dict):
-                # Check if this is an image_url type
-                if item.get("type") == "image_url":
-                    new_item = process_image_url_item(item)
-                    new_content.append(new_item)
-                else:
-                    new_content.append(item)
-            else:
-                new_content.append(item)
-
-        # Create new AIMessage with updated content
-        return AIMessage(
-            content=new_content,
-            additional_kwargs=message.additional_kwargs
-            if hasattr(message, "additional_kwargs")
-            else {},
-            id=message.id if hasattr(message, "id") else None,
-        )
-
-    return message
-
-
-def process_image_url_item(item: dict, use_base64: bool = True) -> dict:
-    """
-    Process a single image_url content item to convert chatbot:// URL to blob URL.
-
-    Expected input format:
-    {
-        "type": "image_url",
-        "image_url": {
-            "url": "chatbot://{attachment_id}"
-        }
-    }
-
-    Output format:
-        if use_base64 false
-    {
-        "type": "image_url",
-        "image_url": {
-            "url": "https://storage.blob.core.windows.net/...?sas_token"
-        }
-    }
-        if use_base64 true
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": "data:image/jpg;base64,ASDAJSLDKJASD...."
-            }
-        }
-
-    Args:
-        item: Dictionary containing image_url content
-
-    Returns:
-        dict: Updated item with blob URL
-    """
-    try:
-        # Get the URL from the nested structure
-        image_url_obj = item.get("image_url", {})
-        url = image_url_obj.get("url", "")
-
-        # Check if it's a chatbot:// URL
-        if url.startswith("chatbot://"):
-            # Extract attachment ID and sanitize it
-            attachment_id = url.replace("chatbot://", "")
-            # Remove trailing slashes and whitespace
-            attachment_id = attachment_id.rstrip("/").strip()
-
-            if not attachment_id:
-                # Empty ID after sanitization
-                print(
-                    f"Warning: Empty attachment ID after sanitization from URL: {url}"
-                )
-                return item
-
-            # Get attachment from database
-            attachment = db_manager.get_attachment(attachment_id)
-
-            if attachment:
-                # Get temporary blob URL with SAS token (valid for 1 hour)
-                if use_base64:
-                    mime_type, blob_base64 = get_file_base64(attachment.blob_name)
-                    base_64_compiled = f"data:{mime_type};base64,{blob_base64}"
-                    return {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": base_64_compiled,
-                        },
-                    }
-                else:
-                    blob_url = get_file_temporary_link(
-                        attachment.blob_name, expiry=3600
-                    )
-
-                    # Return updated item with blob URL
-                    return {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": blob_url,
-                            # Preserve any additional fields
-                            **{k: v for k, v in image_url_obj.items() if k != "url"},
-                        },
+            if isinstance(item, dict) and item.get("type") == "image_url":
+                url = item.get("image_url", {}).get("url", "")
+                if url.startswith("chatbot://"):
+                    data_url = resolved.get(_attachment_id_from_url(url))
+                    if data_url is not None:
+                        item = {"type": "image_url", "image_url": {"url": data_url}}
+            elif (
+                isinstance(item, dict)
+                and item.get("type") == "file"
+                and item.get("source_type") == "url"
+                and item.get("url", "").startswith("chatbot://")
+            ):
+                # Files offloaded at ingress go back to the model as base64
+                data_url = resolved.get(_attachment_id_from_url(item["url"]))
+                if data_url is not None:
+                    header, data = data_url.split(",", 1)
+                    item = {
+                        "type": "file",
+                        "source_type": "base64",
+                        "filename": item.get("filename"),
+                        "mime_type": item.get("mime_type")
+                        or header[len("data:") :].split(";", 1)[0],
+                        "data": data,
                     }
-            else:
-                # Attachment not found, log warning and return original
-                print(f"Warning: Attachment not found for ID: {attachment_id}")
-                return item
-        else:
-            # Not a chatbot:// URL, return as is (might be http/https URL)
-            return item
+            new_content.append(item)
+        return new_content
 
-    except Exception as e:
-        # If any error occurs, log it and return original item
-        print(f"Error processing image_url item: {e}")
-        return item
+    processed_messages = []
+    for message in messages:
+        if isinstance(message, (HumanMessage, AIMessage)) and isinstance(
+            message.content, list
+        ):
+            new_content = replace(message.content)
+            # Copy so tool calls, names and metadata are kept
+            if any(new is not old for new, old in zip(new_content, message.content)):
+                message = message.model_copy(update={"content": new_content})
+        processed_messages.append(message)
+
+    return processed_messages
 
 
 def extract_file_ids_from_messages(messages: List[BaseMessage]) -> List[str]:
@@ -261,11 +160,15 @@ def extract_file_ids_from_messages(messages: List[BaseMessage]) -> List[str]:
                     if url.startswith("chatbot://"):
                         file_id = url.replace("chatbot://", "")
                         file_ids.append(file_id)
+                elif isinstance(item, dict) and item.get("type") == "file":
+                    url = item.get("url", "")
+                    if item.get("source_type") == "url" and url.startswith("chatbot://"):
+                        file_ids.append(url.replace("chatbot://", ""))
 
     return file_ids
 
 
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 
 from langchain_core.messages import (
     AIMessage,
@@ -274,6 +177,62 @@ from langchain_core.messages import (
     SystemMessage,
     ToolMessage,
 )
+from langchain_core.messages.utils import count_tokens_approximately
+
+
+def count_message_tokens(message: BaseMessage) -> int:
+    """Approximate token count of a single message."""
+    return count_tokens_approximately([message])
+
+
+def trim_history(
+    messages: List[BaseMessage],
+    token_counts: Dict[str, int],
+    max_tokens: int,
+) -> Tuple[List[BaseMessage], Dict[str, int]]:
+    """
+    Keep the most recent messages that fit in ``max_tokens``.
+
+    Same result as ``trim_messages(strategy="last", start_on="human",
+    end_on=("human", "tool"))`` with ``count_tokens_approximately``, but
+    token counts are looked up in ``token_counts`` (message id -> count) and
+    only messages without a cached count are counted. The walk starts at the
+    newest message and stops as soon as the budget is used up, so older
+    history is never touched.
+
+    Args:
+        messages: Messages from the agent state
+        token_counts: Cached per-message token counts
+        max_tokens: Token budget for the history
+
+    Returns:
+        Tuple of the trimmed messages and the counts computed for messages
+        that were not cached yet
+    """
+    new_counts: Dict[str, int] = {}
+
+    end = len(messages)
+    while end > 0 and not isinstance(messages[end - 1], (HumanMessage, ToolMessage)):
+        end -= 1
+
+    total = 0
+    start = end
+    while start > 0:
+        message = messages[start - 1]
+        count = token_counts.get(message.id) if message.id else None
+        if count is None:
+            count = count_message_tokens(message)
+            if message.id:
+                new_counts[message.id] = count
+        if total + count > max_tokens:
+            break
+        total += count
+        start -= 1
+
+    while start < end and not isinstance(messages[start], HumanMessage):
+        start += 1
+
+    return messages[start:end], new_counts
 
 
 def get_text_from_contents(contents: list[dict]) -> str:
@@ -342,8 +301,9 @@ def sanitize_and_validate_messages(messages: List[BaseMessage]) -> List[BaseMess
                 i = j  # Skip past the tool messages we just processed
             else:
                 # Skip this incomplete tool call sequence
-                print(
-                    f"Skipping incomplete tool call sequence. Missing responses for: {tool_call_ids - found_tool_responses}"
+                logger.debug(
+                    "Skipping incomplete tool call sequence. Missing responses for: %s",
+                    tool_call_ids - found_tool_responses,
                 )
                 i = j  # Skip past any partial tool messages
 
@@ -360,17 +320,63 @@ def sanitize_and_validate_messages(messages: List[BaseMessage]) -> List[BaseMess
 
         # Skip orphaned ToolMessages (shouldn't happen with proper sequencing, but safety check)
         elif isinstance(current_message, ToolMessage):
-            print(f"Skipping orphaned ToolMessage: {current_message.tool_call_id}")
+            logger.debug("Skipping orphaned ToolMessage: %s", current_message.tool_call_id)
             i += 1
 
         else:
             # Unknown message type, skip
-            print(f"Skipping unknown message type: {type(current_message)}")
+            logger.debug("Skipping unknown message type: %s", type(current_message))
             i += 1
 
     return sanitized_messages
 
 
+def sanitize_new_messages(
+    messages: List[BaseMessage],
+    validated_until: Optional[str],
+    dropped_ids: Set[str],
+) -> Tuple[List[BaseMessage], Optional[str], List[str]]:
+    """
+    Incremental version of ``sanitize_and_validate_messages``.
+
+    Messages up to ``validated_until`` were already checked on an earlier
+    call; only the ones that were dropped then (``dropped_ids``) are removed
+    from that prefix. The messages after it are validated as usual. Since
+    the graph only calls the model when the history ends with a user message
+    or tool results, the validated prefix always ends on a complete tool call
+    sequence and earlier decisions stay valid.
+
+    Args:
+        messages: Trimmed history, oldest first
+        validated_until: Id of the last message validated on an earlier call
+        dropped_ids: Ids of messages dropped on earlier calls
+
+    Returns:
+        Tuple of the sanitized messages, the new ``validated_until`` and the
+        ids dropped from the newly validated messages
+    """
+    split = 0
+    if validated_until:
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].id == validated_until:
+                split = i + 1
+                break
+
+    prefix = messages[:split]
+    if dropped_ids:
+        prefix = [m for m in prefix if m.id not in dropped_ids]
+
+    tail = messages[split:]
+    if not tail:
+        return prefix, validated_until, []
+
+    sanitized_tail = sanitize_and_validate_messages(tail)
+    kept = {id(m) for m in sanitized_tail}
+    newly_dropped = [m.id for m in tail if id(m) not in kept and m.id]
+
+    return prefix + sanitized_tail, tail[-1].id or validated_until, newly_dropped
+
+
 def validate_message_sequence(messages: List[BaseMessage]) -> bool:
     """
     Validate that the message sequence follows OpenAI API requirements.
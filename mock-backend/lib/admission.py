@@ -0,0 +1,151 @@
+"""Admission control for chat runs that call the LLM."""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Deque
+
+from lib.application_config import (
+    get_application_config,
+    get_int_application_config_value,
+)
+from lib.metrics import Counter, Gauge, Histogram
+
+ADMISSION_ACTIVE_RUNS = Gauge(
+    "chat_admission_active_runs", "Chat runs currently holding an admission slot"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "chat_admission_queue_depth", "Chat requests waiting for an admission slot"
+)
+ADMISSION_WAIT = Histogram(
+    "chat_admission_wait_seconds",
+    "Time chat requests spent waiting for an admission slot",
+    ["outcome"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+ADMISSION_REJECTED = Counter(
+    "chat_admission_rejected_total",
+    "Chat requests rejected by admission control",
+    ["reason"],
+)
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a chat run cannot be admitted; maps to a 503."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server is busy ({reason}), please retry later")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds how many chat runs talk to the LLM at once.
+
+    Requests over the concurrency limit wait in a bounded queue. Waiters are
+    grouped per user and slots are handed out round-robin across users, so
+    one user sending a burst cannot starve everyone else. Requests are
+    rejected straight away when the queue (or the user's share of it) is
+    full, and after ``queue_timeout_seconds`` of waiting.
+    """
+
+    def __init__(self):
+        config = get_application_config()
+        self.max_concurrent = max(
+            get_int_application_config_value(
+                config, "admission.max_concurrent_runs", 16
+            ),
+            1,
+        )
+        self.max_queue_size = get_int_application_config_value(
+            config, "admission.max_queue_size", 64
+        )
+        self.max_queued_per_user = get_int_application_config_value(
+            config, "admission.max_queued_per_user", 4
+        )
+        self.queue_timeout = get_int_application_config_value(
+            config, "admission.queue_timeout_seconds", 30
+        )
+        self.retry_after = get_int_application_config_value(
+            config, "admission.retry_after_seconds", 5
+        )
+
+        self._active = 0
+        self._queued = 0
+        # userid -> waiters in arrival order; key order is the round-robin order
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    def _reject(self, reason: str) -> AdmissionRejectedError:
+        ADMISSION_REJECTED.inc(reason=reason)
+        print(f"  🚦 Chat run rejected: {reason} (active={self._active}, queued={self._queued})")
+        return AdmissionRejectedError(reason, self.retry_after)
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE_RUNS.set(self._active)
+        ADMISSION_QUEUE_DEPTH.set(self._queued)
+
+    async def acquire(self, userid: str):
+        """Wait for a slot. Raises AdmissionRejectedError if none is available."""
+        if self._active < self.max_concurrent and self._queued == 0:
+            self._active += 1
+            self._update_gauges()
+            ADMISSION_WAIT.observe(0, outcome="admitted")
+            return
+
+        if self._queued >= self.max_queue_size:
+            raise self._reject("queue_full")
+        user_waiters = self._waiting.get(userid)
+        if user_waiters is not None and len(user_waiters) >= self.max_queued_per_user:
+            raise self._reject("user_queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(userid, deque()).append(waiter)
+        self._queued += 1
+        self._update_gauges()
+        started = time.monotonic()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._remove_waiter(userid, waiter)
+                ADMISSION_WAIT.observe(time.monotonic() - started, outcome="timeout")
+                raise self._reject("timeout")
+        except asyncio.CancelledError:
+            # The client went away while waiting; give the slot back if it
+            # was granted in the meantime
+            if waiter.done():
+                self.release()
+            else:
+                self._remove_waiter(userid, waiter)
+            raise
+
+        ADMISSION_WAIT.observe(time.monotonic() - started, outcome="admitted")
+
+    def release(self):
+        """Free a slot and hand it to the next waiting user."""
+        self._active = max(self._active - 1, 0)
+        while self._active < self.max_concurrent and self._waiting:
+            userid, waiters = self._waiting.popitem(last=False)
+            waiter = waiters.popleft()
+            if waiters:
+                # Re-queue the user at the back for round-robin
+                self._waiting[userid] = waiters
+            self._queued -= 1
+            self._active += 1
+            waiter.set_result(None)
+        self._update_gauges()
+
+    def _remove_waiter(self, userid: str, waiter: asyncio.Future):
+        waiters = self._waiting.get(userid)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self._waiting[userid]
+        self._queued -= 1
+        waiter.cancel()
+        self._update_gauges()
+
+
+chat_admission = AdmissionController()
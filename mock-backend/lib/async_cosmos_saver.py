@@ -0,0 +1,923 @@
+"""Async LangGraph checkpointer backed by azure.cosmos.aio."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from azure.cosmos import PartitionKey
+from azure.cosmos.aio import ContainerProxy, CosmosClient
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosResourceNotFoundError
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    PendingWrite,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph_checkpoint_cosmosdb.cosmosSerializer import CosmosSerializer
+from langgraph_checkpoint_cosmosdb.cosmosdbSaver import (
+    _load_writes,
+    _make_cosmosdb_checkpoint_key,
+    _make_cosmosdb_checkpoint_writes_key,
+    _parse_cosmosdb_checkpoint_data,
+    _parse_cosmosdb_checkpoint_key,
+    _parse_cosmosdb_checkpoint_writes_key,
+)
+
+from lib.metrics import Counter, Gauge, Histogram
+
+# Upper bound of the backoff between retries of a failed flush
+MAX_FLUSH_RETRY_SECONDS = 30
+# Appended to the serialization type of delta items, so readers that do
+# not rebuild messages fail on them instead of returning a partial history
+DELTA_TYPE_SUFFIX = "+delta"
+
+CHECKPOINT_REQUEST_UNITS = Counter(
+    "checkpoint_request_units_total",
+    "Cosmos DB request units charged to the checkpointer",
+    ["operation"],
+)
+CHECKPOINT_FLUSH_DURATION = Histogram(
+    "checkpoint_flush_duration_seconds",
+    "Time spent persisting checkpoints and pending writes",
+    ["trigger"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+CHECKPOINT_ITEMS = Counter(
+    "checkpoint_items_total",
+    "Checkpoint and pending write items, written or dropped before a flush",
+    ["outcome"],
+)
+CHECKPOINT_WRITTEN_BYTES = Counter(
+    "checkpoint_written_bytes_total",
+    "Serialized size of the checkpoints written, by storage format",
+    ["format"],
+)
+CHECKPOINT_BUFFERED_THREADS = Gauge(
+    "checkpoint_buffered_threads",
+    "Threads with checkpoints waiting to be written to Cosmos DB",
+)
+
+
+def _charge(operation: str) -> Callable[[Any, Any], None]:
+    """Response hook adding the request charge of a Cosmos DB call."""
+
+    def hook(headers, _):
+        CHECKPOINT_REQUEST_UNITS.inc(
+            float(headers.get("x-ms-request-charge") or 0), operation=operation
+        )
+
+    return hook
+
+
+def _serialized_type(item: Dict[str, Any]) -> str:
+    """Serialization type of a checkpoint item, without the delta suffix."""
+    type_ = item["type"]
+    if type_.endswith(DELTA_TYPE_SUFFIX):
+        return type_[: -len(DELTA_TYPE_SUFFIX)]
+    return type_
+
+
+class _StoredMessages(NamedTuple):
+    """Messages of the last checkpoint written for a thread."""
+
+    item_id: str
+    messages: List[BaseMessage]
+    # Deltas between this checkpoint and its full snapshot
+    depth: int
+    snapshot_id: str
+
+
+class _ThreadBuffer:
+    """Items of one thread that have not been written to Cosmos DB yet."""
+
+    def __init__(self):
+        # Checkpoint item id -> (item, checkpoint it was serialized from)
+        self.checkpoints: Dict[str, Tuple[Dict[str, Any], Checkpoint]] = {}
+        # Checkpoint id -> write item id -> (item, overwrite)
+        self.writes: Dict[str, Dict[str, Tuple[Dict[str, Any], bool]]] = {}
+
+    def add_writes(self, checkpoint_id: str, items: List[Dict[str, Any]], upsert: bool):
+        writes = self.writes.setdefault(checkpoint_id, {})
+        for item in items:
+            # Like create_item, a write that is not an upsert never replaces one
+            if upsert or item["id"] not in writes:
+                writes[item["id"]] = (item, upsert)
+
+    def merge(self, newer: "_ThreadBuffer"):
+        self.checkpoints.update(newer.checkpoints)
+        for checkpoint_id, writes in newer.writes.items():
+            for item, upsert in writes.values():
+                self.add_writes(checkpoint_id, [item], upsert)
+
+    def coalesce(self) -> int:
+        """Keep only the latest checkpoint and the writes it has not absorbed.
+
+        The latest checkpoint is re-parented onto its nearest ancestor that
+        is not buffered (the last one written), so the history stays a
+        chain of persisted checkpoints. Returns the number of items dropped.
+        """
+        if not self.checkpoints:
+            return 0
+        latest = max(self.checkpoints)
+        key = _parse_cosmosdb_checkpoint_key(latest)
+        latest_id = key["checkpoint_id"]
+        dropped = len(self.checkpoints) - 1
+
+        data, checkpoint = self.checkpoints[latest]
+        parent_id = data["parent_checkpoint_id"]
+        while parent_id:
+            parent = self.checkpoints.get(
+                _make_cosmosdb_checkpoint_key(
+                    key["thread_id"], key["checkpoint_ns"], parent_id
+                )
+            )
+            if parent is None:
+                break
+            parent_id = parent[0]["parent_checkpoint_id"]
+        if parent_id != data["parent_checkpoint_id"]:
+            data = {**data, "parent_checkpoint_id": parent_id}
+        self.checkpoints = {latest: (data, checkpoint)}
+        for checkpoint_id in [c for c in self.writes if c < latest_id]:
+            dropped += len(self.writes.pop(checkpoint_id))
+        return dropped
+
+    def item_count(self) -> int:
+        return len(self.checkpoints) + sum(len(w) for w in self.writes.values())
+
+
+class AsyncCosmosDBSaver(BaseCheckpointSaver):
+    """Checkpointer that talks to Cosmos DB without blocking the event loop.
+
+    Items are stored exactly like ``langgraph_checkpoint_cosmosdb.CosmosDBSaver``
+    does (ids, partition keys and the base64 serializer), so threads written
+    by either saver can be read by the other.
+
+    The latest checkpoint of a thread is found with a ``TOP 1`` query
+    instead of reading every checkpoint of the thread, and a checkpoint and
+    its pending writes are read concurrently when the id is known.
+
+    With ``write_behind``, checkpoints and pending writes are kept in memory
+    and written ``flush_interval_seconds`` after the first of them, or when
+    ``aflush`` is called at the end of a turn. Reads see buffered items. A
+    flush only writes the latest checkpoint of the thread and the writes
+    made since, so intermediate checkpoints superseded in the meantime never
+    reach Cosmos DB; the written checkpoint's parent is set to the last
+    checkpoint written before it, so the thread history skips them. A
+    failed flush is retried in the background with exponential backoff (up
+    to ``MAX_FLUSH_RETRY_SECONDS`` apart). Buffered items are lost if the
+    worker dies before they are flushed.
+
+    With a positive ``snapshot_interval``, a checkpoint whose messages start
+    with the messages of the last checkpoint written for the thread only
+    stores the appended messages, plus a reference to that checkpoint
+    (``messages_base``), and has ``+delta`` appended to its serialization
+    type. Every ``snapshot_interval``-th checkpoint, and any
+    checkpoint that rewrites earlier messages, is stored in full. Reads
+    rebuild the list from the chain back to the last full snapshot, fetched
+    with one range query; the messages last written or read per thread are
+    kept in memory so the common case needs no extra reads. Items without
+    ``messages_base`` (including those written before delta encoding) are
+    full snapshots, so existing threads need no migration; they are
+    continued with deltas on their next write. Delta items can only be read
+    by this saver; other readers fail on their unknown type. Delta encoding
+    is off by default (``snapshot_interval`` 0).
+
+    The sync interface is only there for code running in worker threads; it
+    schedules the async methods on the event loop the saver was first used
+    on.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        key: str,
+        database_name: str,
+        container_name: str,
+        write_behind: bool = False,
+        flush_interval_seconds: float = 0.25,
+        snapshot_interval: int = 0,
+        message_cache_threads: int = 256,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        super().__init__(serde=serde)
+        self.endpoint = endpoint
+        self.key = key
+        self.database_name = database_name
+        self.container_name = container_name
+        self.write_behind = write_behind
+        self.flush_interval_seconds = flush_interval_seconds
+        self.snapshot_interval = snapshot_interval
+        self.message_cache_threads = message_cache_threads
+        self.cosmos_serde = CosmosSerializer(self.serde)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[CosmosClient] = None
+        self._container: Optional[ContainerProxy] = None
+        self._init_lock: Optional[asyncio.Lock] = None
+        # Keyed by the checkpoint partition key (thread id and namespace)
+        self._buffers: Dict[str, _ThreadBuffer] = {}
+        self._flushing: Dict[str, _ThreadBuffer] = {}
+        # Lock and number of flushes using it, dropped when unused
+        self._flush_locks: Dict[str, List[Any]] = {}
+        self._flush_timers: Dict[str, asyncio.Task] = {}
+        # Consecutive failed flushes, for the retry backoff
+        self._flush_failures: Dict[str, int] = {}
+        self._stored: "OrderedDict[str, _StoredMessages]" = OrderedDict()
+
+    async def _get_container(self) -> ContainerProxy:
+        if self._container is not None:
+            return self._container
+
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+        async with self._init_lock:
+            if self._container is None:
+                self.loop = asyncio.get_running_loop()
+                self._client = CosmosClient(self.endpoint, self.key)
+                database = await self._client.create_database_if_not_exists(
+                    self.database_name
+                )
+                self._container = await database.create_container_if_not_exists(
+                    id=self.container_name,
+                    partition_key=PartitionKey(path="/partition_key"),
+                )
+                print("✅ Async Cosmos DB checkpointer connected")
+        return self._container
+
+    async def aclose(self):
+        """Flush buffered checkpoints and close the Cosmos client.
+
+        Called from the FastAPI shutdown hook.
+        """
+        for timer in self._flush_timers.values():
+            timer.cancel()
+        self._flush_timers.clear()
+        for partition_key in list(self._buffers):
+            try:
+                await self._flush(partition_key, "shutdown")
+            except Exception as e:
+                print(f"  ⚠️ Failed to flush checkpoints on shutdown: {e}")
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._container = None
+
+    async def _query(
+        self,
+        container: ContainerProxy,
+        query: str,
+        partition_key: str,
+        parameters: Sequence[Dict[str, Any]] = (),
+    ) -> List[Dict[str, Any]]:
+        return [
+            item
+            async for item in container.query_items(
+                query=query,
+                parameters=[
+                    {"name": "@partition_key", "value": partition_key},
+                    *parameters,
+                ],
+                partition_key=partition_key,
+                response_hook=_charge("read"),
+            )
+        ]
+
+    def _buffered_checkpoints(self, partition_key: str) -> Dict[str, Dict[str, Any]]:
+        items: Dict[str, Dict[str, Any]] = {}
+        for buffers in (self._flushing, self._buffers):
+            buffer = buffers.get(partition_key)
+            if buffer is not None:
+                items.update(
+                    (key, item) for key, (item, _) in buffer.checkpoints.items()
+                )
+        return items
+
+    def _buffered_writes(
+        self, partition_key: str, checkpoint_id: str
+    ) -> Dict[str, Dict[str, Any]]:
+        items: Dict[str, Dict[str, Any]] = {}
+        for buffers in (self._flushing, self._buffers):
+            buffer = buffers.get(partition_key)
+            if buffer is not None:
+                for item, _ in buffer.writes.get(checkpoint_id, {}).values():
+                    items[item["id"]] = item
+        return items
+
+    async def _aload_pending_writes(
+        self,
+        container: ContainerProxy,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str,
+        buffered_only: bool = False,
+    ) -> List[PendingWrite]:
+        """Pending writes of a checkpoint, from Cosmos DB and the buffer.
+
+        With ``buffered_only`` (the checkpoint itself is still buffered, so
+        none of its writes have been flushed) Cosmos DB is not queried.
+        """
+        writes: Dict[str, Dict[str, Any]] = {}
+        if not buffered_only:
+            partition_key = _make_cosmosdb_checkpoint_writes_key(
+                thread_id, checkpoint_ns, checkpoint_id, "", ""
+            )
+            for write in await self._query(
+                container,
+                "SELECT * FROM c WHERE c.partition_key=@partition_key",
+                partition_key,
+            ):
+                writes[write["id"]] = write
+        writes.update(
+            self._buffered_writes(
+                _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, ""),
+                checkpoint_id,
+            )
+        )
+
+        parsed_keys = [
+            _parse_cosmosdb_checkpoint_writes_key(write_id) for write_id in writes
+        ]
+        return _load_writes(
+            self.cosmos_serde,
+            {
+                (parsed_key["task_id"], parsed_key["idx"]): write
+                for write, parsed_key in sorted(
+                    zip(writes.values(), parsed_keys), key=lambda x: x[1]["idx"]
+                )
+            },
+        )
+
+    async def _aread_checkpoint(
+        self, container: ContainerProxy, key: str, partition_key: str
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            return await container.read_item(
+                item=key, partition_key=partition_key, response_hook=_charge("read")
+            )
+        except CosmosResourceNotFoundError:
+            return None
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        container = await self._get_container()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        partition_key = _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, "")
+        buffered = self._buffered_checkpoints(partition_key)
+
+        if checkpoint_id:
+            key = _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, checkpoint_id)
+            if key in buffered:
+                data = buffered[key]
+                pending_writes = await self._aload_pending_writes(
+                    container, thread_id, checkpoint_ns, checkpoint_id, True
+                )
+            else:
+                data, pending_writes = await asyncio.gather(
+                    self._aread_checkpoint(container, key, partition_key),
+                    self._aload_pending_writes(
+                        container, thread_id, checkpoint_ns, checkpoint_id
+                    ),
+                )
+        elif buffered:
+            # Buffered checkpoints are newer than any written one
+            data = buffered[max(buffered)]
+            checkpoint_id = _parse_cosmosdb_checkpoint_key(data["id"])["checkpoint_id"]
+            pending_writes = await self._aload_pending_writes(
+                container, thread_id, checkpoint_ns, checkpoint_id, True
+            )
+        else:
+            # Checkpoint ids sort by creation time and share the key prefix,
+            # so the largest key is the latest checkpoint
+            items = await self._query(
+                container,
+                "SELECT TOP 1 * FROM c WHERE c.partition_key=@partition_key ORDER BY c.id DESC",
+                partition_key,
+            )
+            if not items:
+                return None
+            data = items[0]
+            checkpoint_id = _parse_cosmosdb_checkpoint_key(data["id"])["checkpoint_id"]
+            pending_writes = await self._aload_pending_writes(
+                container, thread_id, checkpoint_ns, checkpoint_id
+            )
+            checkpoint_tuple = await self._aparse(container, data, pending_writes)
+            # The next checkpoint of the thread can be a delta against this one
+            self._remember_read(data, checkpoint_tuple)
+            return checkpoint_tuple
+
+        if not data:
+            return None
+        return await self._aparse(container, data, pending_writes)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None:
+            raise ValueError("AsyncCosmosDBSaver.alist needs a thread_id in config")
+        container = await self._get_container()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        partition_key = _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, "")
+
+        items = {
+            item["id"]: item
+            for item in await self._query(
+                container,
+                "SELECT * FROM c WHERE c.partition_key=@partition_key",
+                partition_key,
+            )
+        }
+        buffered = self._buffered_checkpoints(partition_key)
+        items.update(buffered)
+
+        before_id = get_checkpoint_id(before) if before else None
+        returned = 0
+        # Item id -> rebuilt messages, shared by the checkpoints of the chain
+        rebuilt: Dict[str, List[BaseMessage]] = {}
+        for key in sorted(items, reverse=True):
+            data = items[key]
+            if "checkpoint" not in data or "metadata" not in data:
+                continue
+            checkpoint_id = _parse_cosmosdb_checkpoint_key(key)["checkpoint_id"]
+            if before_id and checkpoint_id >= before_id:
+                continue
+            if filter:
+                metadata = self.cosmos_serde.loads_typed(data["metadata"])
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            if limit is not None and returned >= limit:
+                return
+
+            pending_writes = await self._aload_pending_writes(
+                container, thread_id, checkpoint_ns, checkpoint_id, key in buffered
+            )
+            checkpoint_tuple = await self._aparse(
+                container, data, pending_writes, rebuilt
+            )
+            if checkpoint_tuple is not None:
+                returned += 1
+                yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = checkpoint["id"]
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        partition_key = _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, "")
+
+        data = {
+            "partition_key": partition_key,
+            "id": _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, checkpoint_id),
+            "metadata": self.cosmos_serde.dumps_typed(metadata),
+            "parent_checkpoint_id": parent_checkpoint_id or "",
+        }
+        if self.write_behind:
+            # Buffered in full so reads can use it; encoded when flushed
+            type_, serialized_checkpoint = self.cosmos_serde.dumps_typed(checkpoint)
+            data.update(checkpoint=serialized_checkpoint, type=type_)
+            self._buffer(partition_key).checkpoints[data["id"]] = (data, checkpoint)
+        else:
+            container = await self._get_container()
+            started = time.monotonic()
+            await self._write_checkpoint(container, data, checkpoint)
+            CHECKPOINT_FLUSH_DURATION.observe(
+                time.monotonic() - started, trigger="write_through"
+            )
+            CHECKPOINT_ITEMS.inc(outcome="written")
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        partition_key = _make_cosmosdb_checkpoint_writes_key(
+            thread_id, checkpoint_ns, checkpoint_id, "", ""
+        )
+        # Special channels (errors, interrupts) overwrite; others are written once
+        is_upsert = all(w[0] in WRITES_IDX_MAP for w in writes)
+
+        items = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized_value = self.cosmos_serde.dumps_typed(value)
+            items.append(
+                {
+                    "partition_key": partition_key,
+                    "id": _make_cosmosdb_checkpoint_writes_key(
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint_id,
+                        task_id,
+                        WRITES_IDX_MAP.get(channel, idx),
+                    ),
+                    "channel": channel,
+                    "type": type_,
+                    "value": serialized_value,
+                }
+            )
+
+        if self.write_behind:
+            self._buffer(
+                _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, "")
+            ).add_writes(checkpoint_id, items, is_upsert)
+            return
+
+        container = await self._get_container()
+        started = time.monotonic()
+        await asyncio.gather(
+            *(self._write_item(container, item, is_upsert) for item in items)
+        )
+        CHECKPOINT_FLUSH_DURATION.observe(
+            time.monotonic() - started, trigger="write_through"
+        )
+        CHECKPOINT_ITEMS.inc(len(items), outcome="written")
+
+    async def _write_item(
+        self, container: ContainerProxy, item: Dict[str, Any], upsert: bool
+    ):
+        if upsert:
+            await container.upsert_item(item, response_hook=_charge("write"))
+            return
+        try:
+            await container.create_item(item, response_hook=_charge("write"))
+        except CosmosHttpResponseError as e:
+            if e.status_code != 409:  # Conflict: Item already exists
+                raise
+
+    def _encode_checkpoint(
+        self, data: Dict[str, Any], checkpoint: Checkpoint
+    ) -> Tuple[Dict[str, Any], Optional[_StoredMessages]]:
+        """The item to write for a checkpoint, as a delta when possible.
+
+        Also returns what to remember about its messages once written.
+        """
+        messages = checkpoint["channel_values"].get("messages")
+        delta_base = None
+        if self.snapshot_interval > 0 and isinstance(messages, list):
+            base = self._stored.get(data["partition_key"])
+            if (
+                base is not None
+                and base.item_id < data["id"]
+                and base.depth + 1 < self.snapshot_interval
+                and len(messages) >= len(base.messages)
+                and all(a is b or a == b for a, b in zip(base.messages, messages))
+            ):
+                delta_base = base
+
+        if delta_base is None:
+            item = data
+            if "checkpoint" not in data:
+                type_, serialized_checkpoint = self.cosmos_serde.dumps_typed(checkpoint)
+                item = {**data, "checkpoint": serialized_checkpoint, "type": type_}
+            if self.snapshot_interval <= 0 or not isinstance(messages, list):
+                return item, None
+            return item, _StoredMessages(data["id"], list(messages), 0, data["id"])
+
+        type_, serialized_checkpoint = self.cosmos_serde.dumps_typed(
+            {
+                **checkpoint,
+                "channel_values": {
+                    **checkpoint["channel_values"],
+                    "messages": messages[len(delta_base.messages) :],
+                },
+            }
+        )
+        item = {
+            **data,
+            "checkpoint": serialized_checkpoint,
+            "type": f"{type_}{DELTA_TYPE_SUFFIX}",
+            "messages_base": delta_base.item_id,
+            "messages_base_count": len(delta_base.messages),
+            "messages_depth": delta_base.depth + 1,
+            "messages_snapshot": delta_base.snapshot_id,
+        }
+        stored = _StoredMessages(
+            data["id"], list(messages), delta_base.depth + 1, delta_base.snapshot_id
+        )
+        return item, stored
+
+    async def _write_checkpoint(
+        self, container: ContainerProxy, data: Dict[str, Any], checkpoint: Checkpoint
+    ):
+        item, stored = self._encode_checkpoint(data, checkpoint)
+        await self._write_item(container, item, False)
+        CHECKPOINT_WRITTEN_BYTES.inc(
+            len(item["checkpoint"]),
+            format="delta" if "messages_base" in item else "snapshot",
+        )
+        if stored is not None:
+            self._remember(data["partition_key"], stored)
+
+    def _remember(self, partition_key: str, stored: _StoredMessages):
+        current = self._stored.get(partition_key)
+        if current is not None and current.item_id > stored.item_id:
+            return
+        self._stored[partition_key] = stored
+        self._stored.move_to_end(partition_key)
+        while len(self._stored) > self.message_cache_threads:
+            self._stored.popitem(last=False)
+
+    def _remember_read(
+        self, data: Dict[str, Any], checkpoint_tuple: Optional[CheckpointTuple]
+    ):
+        if self.snapshot_interval <= 0 or checkpoint_tuple is None:
+            return
+        messages = checkpoint_tuple.checkpoint["channel_values"].get("messages")
+        if isinstance(messages, list):
+            self._remember(
+                data["partition_key"],
+                _StoredMessages(
+                    data["id"],
+                    list(messages),
+                    data.get("messages_depth", 0),
+                    data.get("messages_snapshot", data["id"]),
+                ),
+            )
+
+    async def _aparse(
+        self,
+        container: ContainerProxy,
+        data: Dict[str, Any],
+        pending_writes: List[PendingWrite],
+        rebuilt: Optional[Dict[str, List[BaseMessage]]] = None,
+    ) -> Optional[CheckpointTuple]:
+        if "messages_base" in data:
+            data = {**data, "type": _serialized_type(data)}
+        checkpoint_tuple = _parse_cosmosdb_checkpoint_data(
+            self.cosmos_serde, data["id"], data, pending_writes=pending_writes
+        )
+        if checkpoint_tuple is None or "messages_base" not in data:
+            return checkpoint_tuple
+
+        channel_values = checkpoint_tuple.checkpoint["channel_values"]
+        base_messages = await self._abase_messages(container, data, rebuilt)
+        channel_values["messages"] = [
+            *base_messages[: data["messages_base_count"]],
+            *channel_values.get("messages", []),
+        ]
+        if rebuilt is not None:
+            rebuilt[data["id"]] = channel_values["messages"]
+        return checkpoint_tuple
+
+    async def _abase_messages(
+        self,
+        container: ContainerProxy,
+        data: Dict[str, Any],
+        rebuilt: Optional[Dict[str, List[BaseMessage]]] = None,
+    ) -> List[BaseMessage]:
+        """Full messages of the checkpoint a delta item is based on."""
+        partition_key = data["partition_key"]
+        # (base count, appended messages) of each delta, newest first
+        deltas: List[Tuple[int, List[BaseMessage]]] = []
+        fetched: Optional[Dict[str, Dict[str, Any]]] = None
+        item_id = data["messages_base"]
+        while True:
+            stored = self._stored.get(partition_key)
+            if stored is not None and stored.item_id == item_id:
+                messages = stored.messages
+                break
+            if rebuilt is not None and item_id in rebuilt:
+                messages = rebuilt[item_id]
+                break
+
+            item = self._buffered_checkpoints(partition_key).get(item_id)
+            if item is None and fetched is None:
+                # One query for the whole chain back to the snapshot
+                fetched = {
+                    i["id"]: i
+                    for i in await self._query(
+                        container,
+                        "SELECT * FROM c WHERE c.partition_key=@partition_key "
+                        "AND c.id >= @first AND c.id <= @last",
+                        partition_key,
+                        [
+                            {"name": "@first", "value": data["messages_snapshot"]},
+                            {"name": "@last", "value": item_id},
+                        ],
+                    )
+                }
+            if item is None and fetched is not None:
+                item = fetched.get(item_id)
+            if item is None:
+                item = await self._aread_checkpoint(container, item_id, partition_key)
+            if item is None:
+                raise ValueError(
+                    f"Checkpoint {item_id} needed to rebuild the messages of {data['id']} is missing"
+                )
+
+            checkpoint = self.cosmos_serde.loads_typed(
+                (_serialized_type(item), item["checkpoint"])
+            )
+            item_messages = checkpoint["channel_values"].get("messages", [])
+            if "messages_base" not in item:
+                messages = item_messages
+                break
+            deltas.append((item["messages_base_count"], item_messages))
+            item_id = item["messages_base"]
+
+        for base_count, appended in reversed(deltas):
+            messages = [*messages[:base_count], *appended]
+        return messages
+
+    def _buffer(self, partition_key: str) -> _ThreadBuffer:
+        buffer = self._buffers.get(partition_key)
+        if buffer is None:
+            buffer = self._buffers[partition_key] = _ThreadBuffer()
+            CHECKPOINT_BUFFERED_THREADS.set(len(self._buffers))
+        self._schedule_flush(partition_key, self.flush_interval_seconds)
+        return buffer
+
+    def _schedule_flush(self, partition_key: str, delay: float):
+        if partition_key not in self._flush_timers:
+            self._flush_timers[partition_key] = asyncio.create_task(
+                self._flush_later(partition_key, delay)
+            )
+
+    def _retry_flush(self, partition_key: str, error: BaseException):
+        """Schedule another flush of items put back by a failed one."""
+        if partition_key not in self._buffers:
+            return
+        failures = self._flush_failures.get(partition_key, 0) + 1
+        self._flush_failures[partition_key] = failures
+        delay = min(
+            max(self.flush_interval_seconds, 0.05) * 2**failures,
+            MAX_FLUSH_RETRY_SECONDS,
+        )
+        print(f"  ⚠️ Checkpoint flush failed, retrying in {delay:.2f}s: {error!r}")
+        self._schedule_flush(partition_key, delay)
+
+    async def _flush_later(self, partition_key: str, delay: float):
+        await asyncio.sleep(delay)
+        self._flush_timers.pop(partition_key, None)
+        try:
+            await self._flush(partition_key, "background")
+        except Exception as e:
+            self._retry_flush(partition_key, e)
+
+    async def _flush(self, partition_key: str, trigger: str):
+        entry = self._flush_locks.setdefault(partition_key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._flush_locked(partition_key, trigger)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._flush_locks[partition_key]
+
+    async def _flush_locked(self, partition_key: str, trigger: str):
+        buffer = self._buffers.pop(partition_key, None)
+        CHECKPOINT_BUFFERED_THREADS.set(len(self._buffers))
+        if buffer is None:
+            return
+        dropped = buffer.coalesce()
+        if dropped:
+            CHECKPOINT_ITEMS.inc(dropped, outcome="coalesced")
+
+        container = await self._get_container()
+        self._flushing[partition_key] = buffer
+        started = time.monotonic()
+        try:
+            # Writes first: until the checkpoint lands, readers keep
+            # seeing the previous one and ignore these
+            await asyncio.gather(
+                *(
+                    self._write_item(container, item, upsert)
+                    for writes in buffer.writes.values()
+                    for item, upsert in writes.values()
+                )
+            )
+            for data, checkpoint in buffer.checkpoints.values():
+                await self._write_checkpoint(container, data, checkpoint)
+        except BaseException:
+            # Put the items back in front of anything buffered meanwhile
+            newer = self._buffers.get(partition_key)
+            if newer is not None:
+                buffer.merge(newer)
+            self._buffers[partition_key] = buffer
+            CHECKPOINT_BUFFERED_THREADS.set(len(self._buffers))
+            raise
+        finally:
+            self._flushing.pop(partition_key, None)
+
+        self._flush_failures.pop(partition_key, None)
+        CHECKPOINT_FLUSH_DURATION.observe(
+            time.monotonic() - started, trigger=trigger
+        )
+        CHECKPOINT_ITEMS.inc(buffer.item_count(), outcome="written")
+
+    async def aflush(self, thread_id: str, checkpoint_ns: str = ""):
+        """Write the buffered checkpoints of a thread to Cosmos DB.
+
+        Does nothing unless ``write_behind`` is on. Raises if the write
+        fails; the items stay buffered and a background retry is scheduled.
+        """
+        if not self.write_behind:
+            return
+        partition_key = _make_cosmosdb_checkpoint_key(thread_id, checkpoint_ns, "")
+        timer = self._flush_timers.pop(partition_key, None)
+        if timer is not None:
+            timer.cancel()
+        try:
+            await self._flush(partition_key, "turn_end")
+        except BaseException as e:
+            self._retry_flush(partition_key, e)
+            raise
+
+    def _run_sync(self, coro):
+        try:
+            if asyncio.get_running_loop() is self.loop:
+                coro.close()
+                raise asyncio.InvalidStateError(
+                    "Synchronous calls to AsyncCosmosDBSaver are only allowed from a "
+                    "different thread; use the async interface on the event loop."
+                )
+        except RuntimeError:
+            pass
+        if self.loop is None:
+            coro.close()
+            raise asyncio.InvalidStateError(
+                "AsyncCosmosDBSaver has not been used on an event loop yet"
+            )
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._run_sync(self.aget_tuple(config))
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        async def collect():
+            return [
+                item
+                async for item in self.alist(
+                    config, filter=filter, before=before, limit=limit
+                )
+            ]
+
+        yield from self._run_sync(collect())
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self._run_sync(self.aput(config, checkpoint, metadata, new_versions))
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self._run_sync(self.aput_writes(config, writes, task_id, task_path))
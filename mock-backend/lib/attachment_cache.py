@@ -0,0 +1,78 @@
+"""In-memory LRU cache of resolved attachment content."""
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from lib.application_config import (
+    get_application_config,
+    get_int_application_config_value,
+)
+from lib.metrics import Counter, Gauge
+
+ATTACHMENT_CACHE_REQUESTS = Counter(
+    "attachment_cache_requests_total",
+    "Attachment content lookups by result",
+    ["result"],
+)
+ATTACHMENT_CACHE_BYTES = Gauge(
+    "attachment_cache_bytes", "Bytes of attachment content held in the cache"
+)
+
+
+class AttachmentCache:
+    """LRU cache of attachment data URLs keyed by attachment id.
+
+    Attachments are immutable once uploaded, so the resolved
+    ``data:{mime};base64,...`` URL can be reused across turns and tool loop
+    iterations instead of querying Cosmos and downloading the blob again.
+    The cache is bounded by the total size of the cached strings; the least
+    recently used entries are evicted first and entries larger than the
+    whole budget are never cached.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(max_bytes, 0)
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        # Resolution runs in worker threads
+        self._lock = threading.Lock()
+
+    def get(self, attachment_id: str) -> Optional[str]:
+        with self._lock:
+            data_url = self._entries.get(attachment_id)
+            if data_url is not None:
+                self._entries.move_to_end(attachment_id)
+        ATTACHMENT_CACHE_REQUESTS.inc(result="hit" if data_url is not None else "miss")
+        return data_url
+
+    def put(self, attachment_id: str, data_url: str):
+        # Data URLs are ASCII, so the length is the size in bytes
+        size = len(data_url)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(attachment_id, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[attachment_id] = data_url
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+            ATTACHMENT_CACHE_BYTES.set(self._size)
+
+    def invalidate(self, attachment_id: str):
+        with self._lock:
+            previous = self._entries.pop(attachment_id, None)
+            if previous is not None:
+                self._size -= len(previous)
+            ATTACHMENT_CACHE_BYTES.set(self._size)
+
+
+attachment_cache = AttachmentCache(
+    get_int_application_config_value(
+        get_application_config(), "attachments.cache_max_bytes", 256 * 1024 * 1024
+    )
+)
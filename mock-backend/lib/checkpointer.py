@@ -2,15 +2,16 @@ import dotenv
 
 dotenv.load_dotenv()
 
-import os
 from typing import cast
 
-from langgraph_checkpoint_cosmosdb import CosmosDBSaver
-
 from lib.application_config import (
     get_application_config,
+    get_application_config_value,
+    get_int_application_config_value,
     get_required_application_config_value,
 )
+from lib.async_cosmos_saver import AsyncCosmosDBSaver
+from lib.checkpoint_serializer import CompressingSerializer
 
 application_config = get_application_config()
 cosmos_endpoint = get_required_application_config_value(
@@ -21,8 +22,34 @@ cosmos_database_name = get_required_application_config_value(
     application_config, "cosmos.database_name"
 )
 
-os.environ["COSMOSDB_ENDPOINT"] = cast(str, cosmos_endpoint)
-os.environ["COSMOSDB_KEY"] = cast(str, cosmos_key)
+# "write_through" persists every checkpoint before the graph moves on;
+# "write_behind" buffers them and persists the last one at the end of a turn
+checkpointer_mode = get_application_config_value(
+    application_config, "checkpointer.mode", "write_through"
+)
+if checkpointer_mode not in ("write_through", "write_behind"):
+    raise ValueError(f"Unsupported checkpointer.mode: {checkpointer_mode}")
+flush_interval_ms = get_int_application_config_value(
+    application_config, "checkpointer.flush_interval_ms", 250
+)
+# Every this many checkpoints of a thread store all messages; the ones in
+# between only store the messages appended since. Off (0) by default, as
+# delta checkpoints can only be read by AsyncCosmosDBSaver
+snapshot_interval = get_int_application_config_value(
+    application_config, "checkpointer.snapshot_interval", 0
+)
+message_cache_threads = get_int_application_config_value(
+    application_config, "checkpointer.message_cache_threads", 256
+)
+# Payloads of at least compression_threshold_bytes are compressed ("zstd",
+# "zlib" or "none"); compressed and uncompressed items can be mixed. Off by
+# default, as compressed items can only be read by AsyncCosmosDBSaver
+checkpoint_compression = get_application_config_value(
+    application_config, "checkpointer.compression", "none"
+)
+compression_threshold_bytes = get_int_application_config_value(
+    application_config, "checkpointer.compression_threshold_bytes", 1024
+)
 
 # Global cached checkpointer instance
 _checkpointer_instance = None
@@ -31,18 +58,41 @@ _checkpointer_instance = None
 def checkpointer():
     """Get or create the cached checkpointer instance.
 
-    This avoids creating a new SQLite connection on every request.
+    The saver connects to Cosmos DB lazily on its first use from the event
+    loop, so it can be created while the graph is built in a worker thread.
     """
     global _checkpointer_instance
 
     if _checkpointer_instance is not None:
         return _checkpointer_instance
 
-    _checkpointer_instance = CosmosDBSaver(
+    _checkpointer_instance = AsyncCosmosDBSaver(
+        endpoint=cast(str, cosmos_endpoint),
+        key=cast(str, cosmos_key),
         database_name=cast(str, cosmos_database_name),
         container_name="langgraph_checkpoints",
+        write_behind=checkpointer_mode == "write_behind",
+        flush_interval_seconds=flush_interval_ms / 1000,
+        snapshot_interval=snapshot_interval,
+        message_cache_threads=message_cache_threads,
+        serde=CompressingSerializer(
+            compression=checkpoint_compression,
+            threshold_bytes=compression_threshold_bytes,
+        ),
     )
 
-    print("✅ Checkpointer initialized and cached")
+    print(f"✅ Checkpointer initialized and cached ({checkpointer_mode})")
 
     return _checkpointer_instance
+
+
+async def flush_checkpoints(thread_id: str):
+    """Persist the buffered checkpoints of a thread at the end of a turn."""
+    if _checkpointer_instance is not None:
+        await _checkpointer_instance.aflush(thread_id)
+
+
+async def close_checkpointer():
+    """Flush and close the checkpointer's Cosmos client, if it was created."""
+    if _checkpointer_instance is not None:
+        await _checkpointer_instance.aclose()
@@ -5,7 +5,10 @@ import time
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Union
 
-from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from azure.cosmos.exceptions import (
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+)
 
 from lib.db_connection import db_connection
 
@@ -592,5 +595,56 @@ class DatabaseManager:
     async def attachment_exists_async(self, attachment_id: str, userid: str) -> bool:
         return await asyncio.to_thread(self.attachment_exists, attachment_id, userid)
 
+    def record_token_usage(
+        self, conversation_id: str, userid: str, usage: Dict[str, int]
+    ) -> None:
+        """Add one chat turn's token usage to the conversation and to the
+        user's daily total.
+
+        ``usage`` holds ``prompt_tokens``, ``completion_tokens`` and
+        ``cached_prompt_tokens``. Counters are incremented server-side with
+        patch operations so concurrent turns never overwrite each other.
+        """
+        operations = [
+            {"op": "incr", "path": f"/{field}", "value": value}
+            for field, value in usage.items()
+        ]
+        operations.append({"op": "incr", "path": "/turns", "value": 1})
+
+        conversations = db_connection.get_conversations_container()
+        try:
+            conversations.patch_item(
+                item=conversation_id,
+                partition_key=userid,
+                patch_operations=operations,
+            )
+        except CosmosResourceNotFoundError:
+            # Conversation was deleted while the turn was running
+            pass
+
+        usage_container = db_connection.get_usage_container()
+        day = time.strftime("%Y-%m-%d", time.gmtime())
+        item_id = f"{userid}:{day}"
+        try:
+            usage_container.patch_item(
+                item=item_id, partition_key=userid, patch_operations=operations
+            )
+        except CosmosResourceNotFoundError:
+            document = {"id": item_id, "userid": userid, "day": day, **usage, "turns": 1}
+            try:
+                usage_container.create_item(body=document)
+            except CosmosResourceExistsError:
+                # Another turn created the day document first
+                usage_container.patch_item(
+                    item=item_id, partition_key=userid, patch_operations=operations
+                )
+
+    async def record_token_usage_async(
+        self, conversation_id: str, userid: str, usage: Dict[str, int]
+    ) -> None:
+        await asyncio.to_thread(
+            self.record_token_usage, conversation_id, userid, usage
+        )
+
 
 db_manager = DatabaseManager()
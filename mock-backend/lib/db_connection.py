@@ -31,12 +31,14 @@ class CosmosDBConnection:
         self.conversations_container = "conversations"
         self.files_container = "files"
         self.attachments_container = "attachments"
+        self.usage_container = "usage"
 
         self._client: Optional[Any] = None
         self._database: Optional[Any] = None
         self._conversations_container: Optional[Any] = None
         self._files_container: Optional[Any] = None
         self._attachments_container: Optional[Any] = None
+        self._usage_container: Optional[Any] = None
         self._lock = threading.Lock()
 
     async def init_cosmos_client(self):
@@ -70,11 +72,15 @@ class CosmosDBConnection:
                 id=self.attachments_container,
                 partition_key=PartitionKey(path="/userid"),
             )
+            self._usage_container = database.create_container_if_not_exists(
+                id=self.usage_container,
+                partition_key=PartitionKey(path="/userid"),
+            )
 
             print("✅ Cosmos DB client initialized")
             print(f"   Database: {self.database_name}")
             print(
-                f"   Containers: {self.conversations_container}, {self.files_container}, {self.attachments_container}"
+                f"   Containers: {self.conversations_container}, {self.files_container}, {self.attachments_container}, {self.usage_container}"
             )
 
     async def close_cosmos_client(self):
@@ -91,6 +97,7 @@ class CosmosDBConnection:
                 self._conversations_container = None
                 self._files_container = None
                 self._attachments_container = None
+                self._usage_container = None
                 print("🔌 Cosmos DB client closed")
 
     def get_conversations_container(self):
@@ -114,5 +121,12 @@ class CosmosDBConnection:
             )
         return self._attachments_container
 
+    def get_usage_container(self):
+        if not self._usage_container:
+            raise RuntimeError(
+                "Cosmos DB client not initialized. Call init_cosmos_client() first."
+            )
+        return self._usage_container
+
 
 db_connection = CosmosDBConnection()
@@ -0,0 +1,237 @@
+"""Result cache for the agent's retrieval and web search tools."""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from lib.application_config import (
+    get_application_config,
+    get_application_config_value,
+    get_int_application_config_value,
+)
+from lib.metrics import Counter, Gauge
+
+TOOL_CACHE_REQUESTS = Counter(
+    "tool_cache_requests_total",
+    "Tool result cache lookups by tool and result",
+    ["tool", "result"],
+)
+TOOL_CACHE_ENTRIES = Gauge(
+    "tool_cache_entries", "Tool results held in the in-process cache"
+)
+
+# Tools that read the Azure AI Search index and go stale when it changes
+DOCUMENT_SEARCH_TOOLS = ("document_search", "azure_search_filter", "azure_search_vector")
+
+DEFAULT_TTL_SECONDS = {
+    "web_search": 600,
+    "document_search": 300,
+    "azure_search_filter": 300,
+    "azure_search_vector": 300,
+}
+
+
+class ToolCacheBackend:
+    """Storage for cached tool results.
+
+    Keys are ``{tool name}:{digest}`` strings. Subclass this to keep results
+    somewhere shared (e.g. Redis) instead of in the worker process.
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl_seconds: int):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+
+class InMemoryToolCacheBackend(ToolCacheBackend):
+    """Bounded LRU store with per-entry expiry, local to the worker."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(max_entries, 0)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # Sync tools run in worker threads
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                TOOL_CACHE_ENTRIES.set(len(self._entries))
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl_seconds: int):
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            TOOL_CACHE_ENTRIES.set(len(self._entries))
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+            TOOL_CACHE_ENTRIES.set(len(self._entries))
+
+
+def _normalize_args(
+    arguments: Dict[str, Any], normalized: Sequence[str]
+) -> Dict[str, Any]:
+    # Other arguments (e.g. OData filters) are compared exactly, since
+    # whitespace or case may matter inside their literals
+    return {
+        name: (
+            " ".join(value.split()).casefold()
+            if name in normalized and isinstance(value, str)
+            else value
+        )
+        for name, value in arguments.items()
+    }
+
+
+class ToolCache:
+    """Caches tool results by tool name and normalized arguments.
+
+    Only tools with a positive TTL are cached. The ``query`` argument is
+    compared with whitespace collapsed and case-insensitively, so trivially
+    different repeats of a query share an entry; other arguments must match
+    exactly. Results are shared across conversations and users; tools whose
+    results depend on the caller must take that as an argument.
+
+    ``invalidate`` drops every entry of a tool. A call that was already
+    running when its tool was invalidated does not store its result.
+    """
+
+    def __init__(self, backend: ToolCacheBackend, ttl_seconds: Dict[str, int]):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _key(
+        self,
+        tool_name: str,
+        signature: inspect.Signature,
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+        normalized: Sequence[str],
+    ) -> str:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = _normalize_args(dict(bound.arguments), normalized)
+        payload = json.dumps(arguments, sort_keys=True, default=str)
+        return f"{tool_name}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    def _lookup(self, tool_name: str, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        TOOL_CACHE_REQUESTS.inc(
+            tool=tool_name, result="hit" if value is not None else "miss"
+        )
+        if value is not None:
+            print(f"  ♻️ Using cached {tool_name} result")
+        return value
+
+    def _generation(self, tool_name: str) -> int:
+        with self._lock:
+            return self._generations.get(tool_name, 0)
+
+    def _store(self, tool_name: str, key: str, value: Any, generation: int):
+        if not isinstance(value, str):
+            return
+        # Checked and stored under one lock, so an invalidate cannot land
+        # in between and leave this (stale) result behind
+        with self._lock:
+            if self._generations.get(tool_name, 0) != generation:
+                return
+            self.backend.set(key, value, self.ttl_seconds[tool_name])
+
+    def cached(
+        self, tool_name: str, normalized: Sequence[str] = ("query",)
+    ) -> Callable:
+        """Decorator caching the string result of a sync or async function.
+
+        The function must raise on failure; only returned values are cached.
+        """
+
+        def decorator(func: Callable) -> Callable:
+            if self.ttl_seconds.get(tool_name, 0) <= 0:
+                return func
+            signature = inspect.signature(func)
+
+            if asyncio.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    key = self._key(
+                        tool_name, signature, args, kwargs, normalized
+                    )
+                    value = self._lookup(tool_name, key)
+                    if value is not None:
+                        return value
+                    generation = self._generation(tool_name)
+                    result = await func(*args, **kwargs)
+                    self._store(tool_name, key, result, generation)
+                    return result
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = self._key(tool_name, signature, args, kwargs, normalized)
+                value = self._lookup(tool_name, key)
+                if value is not None:
+                    return value
+                generation = self._generation(tool_name)
+                result = func(*args, **kwargs)
+                self._store(tool_name, key, result, generation)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def invalidate(self, *tool_names: str):
+        """Drop all cached results of the given tools."""
+        for tool_name in tool_names:
+            with self._lock:
+                self._generations[tool_name] = self._generations.get(tool_name, 0) + 1
+            self.backend.delete_prefix(f"{tool_name}:")
+
+
+def _create_tool_cache() -> ToolCache:
+    config = get_application_config()
+    backend_name = get_application_config_value(config, "tool_cache.backend", "memory")
+    if backend_name != "memory":
+        raise ValueError(f"Unsupported tool_cache.backend: {backend_name}")
+    backend = InMemoryToolCacheBackend(
+        get_int_application_config_value(config, "tool_cache.max_entries", 1024)
+    )
+    ttl_seconds = {
+        tool_name: get_int_application_config_value(
+            config, f"tool_cache.ttl_seconds.{tool_name}", default
+        )
+        for tool_name, default in DEFAULT_TTL_SECONDS.items()
+    }
+    return ToolCache(backend, ttl_seconds)
+
+
+tool_cache = _create_tool_cache()
@@ -16,6 +16,7 @@ logging.getLogger("azure.cosmos._cosmos_http_logging_policy").setLevel(logging.W
 
 from typing import Annotated
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi import FastAPI, Depends
 from fastapi.concurrency import run_in_threadpool
 from lib.application_config import (
@@ -86,6 +87,12 @@ async def startup_event():
 
     await run_in_threadpool(get_graph)
 
+    # Open model connections before the first chat turn needs them
+    print("🔥 Warming up model HTTP connections...")
+    from agent.http_clients import model_http_clients
+
+    await model_http_clients.warm_up()
+
     print("✅ Server ready")
 
 
@@ -102,6 +109,18 @@ async def shutdown_event():
     print("🔌 Closing Cosmos DB client...")
     await db_connection.close_cosmos_client()
 
+    from lib.checkpointer import close_checkpointer
+
+    await close_checkpointer()
+
+    from agent.http_clients import model_http_clients
+
+    await model_http_clients.aclose()
+
+    from agent.tools import aclose_tool_clients
+
+    await aclose_tool_clients()
+
 
 @app.get("/")
 async def root(username: Annotated[str, Depends(get_authenticated_user)]):
@@ -112,6 +131,16 @@ async def root(username: Annotated[str, Depends(get_authenticated_user)]):
     }
 
 
+@app.get("/metrics")
+async def metrics(_: Annotated[str, Depends(verify_credentials)]):
+    """Prometheus metrics for this worker process."""
+    from lib.metrics import render_metrics
+
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/health")
 async def health():
     """Health check endpoint."""
@@ -32,6 +32,7 @@ from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, Analyze
 from openai import OpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from lib.database import db_manager
+from lib.tool_cache import DOCUMENT_SEARCH_TOOLS, tool_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -451,6 +452,9 @@ def update_indexing_status_v1(
         success = db_manager.update_file_status(file_id, userid, status, error_message)
         if success:
             logger.info(f"Updated file {file_id} status to {status}")
+            if status == "completed":
+                # New chunks are searchable; cached search results are stale
+                tool_cache.invalidate(*DOCUMENT_SEARCH_TOOLS)
         else:
             logger.error(f"Failed to update file {file_id} status to {status}")
         return success
@@ -1,18 +1,15 @@
 """Attachment routes for multimodal chat input."""
 
 import logging
-import uuid
 from typing import Any, Dict, Optional
 
 from fastapi import APIRouter, File, Header, HTTPException, UploadFile, status
 from pydantic import BaseModel
 
-from lib.blob import (
-    delete_file_async,
-    get_file_temporary_link_async,
-    upload_file_to_blob_async,
-)
+from lib.attachment_cache import attachment_cache
+from lib.blob import delete_file_async, get_file_temporary_link_async
 from lib.database import db_manager
+from utils.attachment_ingress import store_attachment_async
 
 
 logging.basicConfig(level=logging.INFO)
@@ -54,8 +51,6 @@ async def upload_attachment(
         )
 
     try:
-        attachment_id = str(uuid.uuid4())
-        blob_name = f"attachments/{userid}/{attachment_id}_{file.filename}"
         file_type = file.content_type or "unknown"
 
         logger.info(
@@ -63,13 +58,8 @@ async def upload_attachment(
         )
 
         file_content = await file.read()
-        await upload_file_to_blob_async(file_content, blob_name)
-        await db_manager.create_attachment_async(
-            attachment_id=attachment_id,
-            userid=userid,
-            filename=file.filename or "unknown",
-            blob_name=blob_name,
-            attachment_type=file_type,
+        attachment_id = await store_attachment_async(
+            file_content, file.filename or "unknown", file_type, userid
         )
 
         logger.info(f"Attachment uploaded successfully: {attachment_id}")
@@ -239,6 +229,7 @@ async def delete_attachment(
 
         await delete_file_async(attachment.blob_name)
         await db_manager.delete_attachment_async(attachment_id, userid)
+        attachment_cache.invalidate(attachment_id)
 
         logger.info(f"Attachment deleted successfully: {attachment_id}")
 
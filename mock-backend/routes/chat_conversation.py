@@ -1,20 +1,24 @@
+import functools
 import json
 import os
 
 from utils.uuid import generate_uuid
 from langchain_core.load import dumps
 from langchain_core.messages.human import HumanMessage
+from lib.admission import AdmissionRejectedError, chat_admission
 from lib.auth import get_authenticated_user
-from utils.stream_protocol import generate_stream
+from utils.stream_protocol import generate_stream, get_chat_stream
 from utils.message_conversion import from_assistant_ui_contents_to_langgraph_contents
+from utils.attachment_ingress import offload_inline_attachments
 
 from typing import Annotated, Any, cast
 from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from openai import AzureOpenAI
 
 from agent.graph import get_graph
+from agent.semantic_cache import semantic_cache
 from lib.database import db_manager
 
 
@@ -24,6 +28,14 @@ class ChatRequest(BaseModel):
 
 chat_conversation_route = APIRouter()
 
+STREAM_RESPONSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Content-Type": "text/plain; charset=utf-8",
+    "Connection": "keep-alive",
+    "x-vercel-ai-data-stream": "v1",
+    "x-vercel-ai-ui-message-stream": "v1",
+}
+
 
 class CreateConversationRequest(BaseModel):
     conversationId: str | None = None
@@ -40,7 +52,6 @@ async def create_new_conversation(
     import time
 
     start = time.time()
-    graph = get_graph()
     if request is None:
         return {"error": "Missing request body"}
 
@@ -120,7 +131,7 @@ async def get_conversations(
         if title == "New Conversation":
             # Get the first message from the conversation to use as title
             conv_graph_val = (
-                graph.get_state(config={"configurable": {"thread_id": conv.id}})
+                await graph.aget_state(config={"configurable": {"thread_id": conv.id}})
             ).values
             conv_graph_messages = (
                 conv_graph_val.get("messages", []) if conv_graph_val else []
@@ -181,7 +192,7 @@ async def get_chat_history(
     try:
         graph = get_graph()
         # Get the conversation state from the checkpointer
-        states_generator = graph.get_state(
+        states_generator = await graph.aget_state(
             config={"configurable": {"thread_id": conversation_id}}
         )
         states = [x for x in states_generator]
@@ -200,6 +211,7 @@ async def get_chat_history(
 @chat_conversation_route.post("/conversations/{conversation_id}/chat")
 async def chat_conversation(
     _: Annotated[str, Depends(get_authenticated_user)],
+    http_request: Request,
     userid: Annotated[str | None, Header()] = None,
     conversation_id: str = "",
     request: ChatRequest | None = None,
@@ -233,16 +245,108 @@ async def chat_conversation(
 
     graph = get_graph()
 
+    # Repeated first questions are answered from the semantic cache without
+    # running the graph, so they do not need an LLM slot
+    lookup = await semantic_cache.lookup(graph, input_message, conversation_id, userid)
+    if lookup is not None and lookup.turn is not None:
+        stream = generate_stream(
+            graph,
+            input_message,
+            conversation_id,
+            http_request,
+            userid,
+            replay=lookup.replay(),
+        )
+        return StreamingResponse(
+            stream,
+            media_type="text/event-stream",
+            headers=STREAM_RESPONSE_HEADERS,
+        )
+
+    # Wait for an LLM slot (or shed load) before the response starts
+    try:
+        await chat_admission.acquire(userid)
+    except AdmissionRejectedError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    try:
+        # Inline files and images go to blob storage instead of every
+        # checkpoint; done once a slot is held, so rejected requests (and
+        # the semantic cache, which only takes text) upload nothing
+        input_message = [
+            HumanMessage(
+                content=await offload_inline_attachments(
+                    last_message_langgraph_content, userid
+                )
+            )
+        ]
+        stream = generate_stream(
+            graph,
+            input_message,
+            conversation_id,
+            http_request,
+            userid,
+            on_complete=chat_admission.release,
+            capture_frames=lookup is not None,
+            on_finished=(
+                functools.partial(semantic_cache.store, lookup)
+                if lookup is not None
+                else None
+            ),
+        )
+    except BaseException:
+        # Including cancellation while uploading, so the slot is not leaked
+        chat_admission.release()
+        raise
+
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers=STREAM_RESPONSE_HEADERS,
+    )
+
+
+@chat_conversation_route.get("/conversations/{conversation_id}/chat/{message_id}/resume")
+async def resume_chat_conversation(
+    _: Annotated[str, Depends(get_authenticated_user)],
+    http_request: Request,
+    userid: Annotated[str | None, Header()] = None,
+    conversation_id: str = "",
+    message_id: str = "",
+    offset: int = 0,
+):
+    """Resume a dropped chat stream.
+
+    Replays the frames of ``message_id`` from ``offset`` (the number of frames
+    the client already received, counting the ``f:`` start frame) and then
+    follows the live stream until the turn finishes.
+    """
+
+    if not userid:
+        return {"error": "Missing userid header"}
+
+    if not await db_manager.conversation_exists_async(conversation_id, userid):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    stream = get_chat_stream(message_id)
+    if stream is None or stream.conversation_id != conversation_id:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+
+    if offset < 0 or offset > stream.buffer.end_offset:
+        raise HTTPException(status_code=400, detail="Invalid stream offset")
+    if offset < stream.buffer.first_offset:
+        raise HTTPException(
+            status_code=410, detail="Stream offset is no longer available"
+        )
+
     return StreamingResponse(
-        generate_stream(graph, input_message, conversation_id),
+        stream.subscribe(offset, http_request),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Content-Type": "text/plain; charset=utf-8",
-            "Connection": "keep-alive",
-            "x-vercel-ai-data-stream": "v1",
-            "x-vercel-ai-ui-message-stream": "v1",
-        },
+        headers=STREAM_RESPONSE_HEADERS,
     )
 
 
@@ -13,6 +13,7 @@ from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from pydantic import BaseModel
 
 from lib.database import FileMetadata, db_manager
+from lib.tool_cache import DOCUMENT_SEARCH_TOOLS, tool_cache
 from orchestration import get_orchestrator
 
 
@@ -314,6 +315,7 @@ async def delete_file(
                     logger.info(
                         f"Deleted {len(doc_ids)} chunks from search index for file {file_id}"
                     )
+                    tool_cache.invalidate(*DOCUMENT_SEARCH_TOOLS)
         except Exception as e:
             logger.warning(f"Failed to delete from search index: {str(e)}")
 
@@ -0,0 +1,136 @@
+"""Moves inline file and image data out of chat messages into attachments."""
+
+import asyncio
+import base64
+import binascii
+import mimetypes
+import uuid
+from typing import Any, Dict, List, Optional
+
+from lib.application_config import (
+    get_application_config,
+    get_int_application_config_value,
+)
+from lib.attachment_cache import attachment_cache
+from lib.blob import upload_file_to_blob_async
+from lib.database import db_manager
+from lib.metrics import Counter
+from utils.message_conversion import decode_file_attachment
+
+# Inline data smaller than this (decoded) stays in the message
+OFFLOAD_MIN_BYTES = get_int_application_config_value(
+    get_application_config(), "attachments.offload_min_bytes", 1024
+)
+
+INLINE_ATTACHMENTS_OFFLOADED = Counter(
+    "chat_inline_attachments_offloaded_total",
+    "Inline message parts stored as attachments at ingress, by part type and result",
+    ["type", "result"],
+)
+INLINE_ATTACHMENT_BYTES = Counter(
+    "chat_inline_attachment_bytes_total",
+    "Decoded size of inline message parts stored as attachments",
+    ["type"],
+)
+
+
+async def store_attachment_async(
+    content: bytes, filename: str, content_type: str, userid: str
+) -> str:
+    """Upload content as an attachment of the user and return its id."""
+    attachment_id = str(uuid.uuid4())
+    blob_name = f"attachments/{userid}/{attachment_id}_{filename}"
+    await upload_file_to_blob_async(content, blob_name)
+    await db_manager.create_attachment_async(
+        attachment_id=attachment_id,
+        userid=userid,
+        filename=filename,
+        blob_name=blob_name,
+        attachment_type=content_type,
+    )
+    return attachment_id
+
+
+def _decode(data: str) -> Optional[bytes]:
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+async def _offload_file(item: Dict[str, Any], userid: str) -> Dict[str, Any]:
+    content = _decode(item.get("data") or "")
+    if content is None or len(content) < OFFLOAD_MIN_BYTES:
+        return item
+
+    mime_type = item.get("mime_type") or "application/octet-stream"
+    filename = item.get("filename") or f"file{mimetypes.guess_extension(mime_type) or ''}"
+    attachment_id = await store_attachment_async(content, filename, mime_type, userid)
+    # Resolved from the cache on the next model call of this worker
+    attachment_cache.put(attachment_id, f"data:{mime_type};base64,{item['data']}")
+    INLINE_ATTACHMENT_BYTES.inc(len(content), type="file")
+    return {
+        "type": "file",
+        "source_type": "url",
+        "url": f"chatbot://{attachment_id}",
+        "mime_type": mime_type,
+        "filename": filename,
+    }
+
+
+async def _offload_image(item: Dict[str, Any], userid: str) -> Dict[str, Any]:
+    url = item.get("image_url", {}).get("url", "")
+    try:
+        image = decode_file_attachment(url)
+    except ValueError:
+        return item
+    content = _decode(image["base64data"])
+    if content is None or len(content) < OFFLOAD_MIN_BYTES:
+        return item
+
+    mime_type = image["mimetype"]
+    filename = image["filename"] or f"image{mimetypes.guess_extension(mime_type) or ''}"
+    attachment_id = await store_attachment_async(content, filename, mime_type, userid)
+    attachment_cache.put(
+        attachment_id, f"data:{mime_type};base64,{image['base64data']}"
+    )
+    INLINE_ATTACHMENT_BYTES.inc(len(content), type="image_url")
+    return {"type": "image_url", "image_url": {"url": f"chatbot://{attachment_id}"}}
+
+
+async def offload_inline_attachments(
+    contents: List[Dict[str, Any]], userid: str
+) -> List[Dict[str, Any]]:
+    """Replace inline base64 file and image parts with ``chatbot://`` references.
+
+    Runs on the LangGraph contents of a new user message before it enters
+    the graph, so the data is uploaded once instead of being stored in
+    every checkpoint and reloaded with the thread. ``change_file_to_url_async``
+    resolves the references when the model is called. Parts smaller than
+    ``attachments.offload_min_bytes`` are left inline, and so is any part
+    whose upload fails.
+    """
+
+    async def offload(item: Any) -> Any:
+        if not isinstance(item, dict):
+            return item
+        if item.get("type") == "file" and item.get("source_type") == "base64":
+            offload_part = _offload_file
+        elif item.get("type") == "image_url" and str(
+            item.get("image_url", {}).get("url", "")
+        ).startswith("data:"):
+            offload_part = _offload_image
+        else:
+            return item
+
+        try:
+            new_item = await offload_part(item, userid)
+        except Exception as e:
+            print(f"  ⚠️ Failed to store inline {item['type']} as an attachment: {e}")
+            INLINE_ATTACHMENTS_OFFLOADED.inc(type=item["type"], result="error")
+            return item
+        if new_item is not item:
+            INLINE_ATTACHMENTS_OFFLOADED.inc(type=item["type"], result="stored")
+        return new_item
+
+    return list(await asyncio.gather(*(offload(item) for item in contents)))
@@ -0,0 +1,73 @@
+"""Bounded in-memory replay buffer for encoded data stream frames."""
+
+import asyncio
+import itertools
+from collections import deque
+from typing import Deque, List
+
+
+class FramesEvictedError(Exception):
+    """Raised when a reader asks for frames that have already been dropped."""
+
+
+class ReplayBuffer:
+    """Ring buffer of the frames emitted for one assistant message.
+
+    Frames are addressed by their absolute offset in the stream (the ``f:``
+    start frame is offset 0). Only the newest ``max_frames`` are kept, so a
+    reader that falls too far behind gets ``FramesEvictedError``. Readers
+    wait for new frames with ``wait`` and stop once the buffer is closed and
+    fully read.
+    """
+
+    def __init__(self, max_frames: int):
+        self._frames: Deque[str] = deque(maxlen=max(max_frames, 1))
+        self._total = 0
+        self._changed = asyncio.Condition()
+        self.closed = False
+
+    @property
+    def first_offset(self) -> int:
+        """Offset of the oldest frame still buffered."""
+        return self._total - len(self._frames)
+
+    @property
+    def end_offset(self) -> int:
+        """Offset the next frame will get (total frames emitted so far)."""
+        return self._total
+
+    async def append(self, frame: str):
+        self._frames.append(frame)
+        self._total += 1
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def close(self):
+        """Mark the stream complete and wake up every reader."""
+        self.closed = True
+        async with self._changed:
+            self._changed.notify_all()
+
+    def read(self, offset: int) -> List[str]:
+        """Return every buffered frame from ``offset`` on."""
+        if offset < self.first_offset:
+            raise FramesEvictedError(
+                f"Frame {offset} was evicted (oldest buffered frame is {self.first_offset})"
+            )
+        return list(
+            itertools.islice(self._frames, offset - self.first_offset, None)
+        )
+
+    async def wait(self, offset: int, timeout: float) -> bool:
+        """Wait until there are frames past ``offset`` or the buffer closes.
+
+        Returns False if the timeout elapsed first.
+        """
+        async with self._changed:
+            if self._total > offset or self.closed:
+                return True
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            return True
@@ -1,24 +1,278 @@
 # You can find the parsing on
 # node_modules/assistant-stream/src/core/serialization/data-stream/chunk-types.ts
 
+import asyncio
 import json
-import re
+import time
 import typing
 import uuid
-from typing import List, Sequence
-
-from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
+from langchain_core.messages.ai import UsageMetadata, add_ai_message_chunks, add_usage
+from fastapi import Request
 from langgraph.graph.state import CompiledStateGraph
 
+from lib.application_config import (
+    get_application_config,
+    get_int_application_config_value,
+)
+from lib.checkpointer import flush_checkpoints
+from lib.database import db_manager
+from lib.metrics import Counter, Histogram
+from utils.stream_buffer import FramesEvictedError, ReplayBuffer
+
 DEBUG_STREAM = False
 
-# Regex to match <reasoning>...</reasoning> tags (including multiline content)
-REASONING_PATTERN = re.compile(r"<reasoning>(.*?)</reasoning>", re.DOTALL)
+REASONING_OPEN_TAG = "<reasoning>"
+REASONING_CLOSE_TAG = "</reasoning>"
+
+# Data stream frame type codes
+TEXT_DELTA = "0"
+ERROR = "3"
+TOOL_CALL_RESULT = "a"
+TOOL_CALL_START = "b"
+TOOL_CALL_ARGS_DELTA = "c"
+FINISH_MESSAGE = "d"
+START_STEP = "f"
+REASONING_DELTA = "g"
+
+Frame = Tuple[str, Any]
+
+_application_config = get_application_config()
+# Deltas are held for at most this long before being flushed (0 disables coalescing)
+COALESCE_WINDOW_MS = get_int_application_config_value(
+    _application_config, "streaming.coalesce_window_ms", 30
+)
+# ...or until this many characters are buffered
+COALESCE_MAX_BYTES = get_int_application_config_value(
+    _application_config, "streaming.coalesce_max_bytes", 2048
+)
+# How often a running chat stream checks whether its client is still connected
+DISCONNECT_POLL_MS = get_int_application_config_value(
+    _application_config, "streaming.disconnect_poll_ms", 500
+)
+# Frames kept per assistant message for clients that resume a dropped stream
+REPLAY_BUFFER_FRAMES = get_int_application_config_value(
+    _application_config, "streaming.replay_buffer_frames", 2048
+)
+# How long a finished stream can still be resumed
+REPLAY_RETENTION_SECONDS = get_int_application_config_value(
+    _application_config, "streaming.replay_retention_seconds", 120
+)
+# How long a run keeps going with no client attached before it is cancelled
+RESUME_GRACE_SECONDS = get_int_application_config_value(
+    _application_config, "streaming.resume_grace_seconds", 15
+)
+
+
+STREAM_TIME_TO_FIRST_TOKEN = Histogram(
+    "chat_stream_time_to_first_token_seconds",
+    "Time from the start of a chat turn to the first text or reasoning token",
+    ["tools"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+STREAM_TIME_TO_FIRST_TOOL_CALL = Histogram(
+    "chat_stream_time_to_first_tool_call_seconds",
+    "Time from the start of a chat turn to the first tool call",
+    ["tools"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+STREAM_INTER_CHUNK_GAP = Histogram(
+    "chat_stream_inter_chunk_gap_seconds",
+    "Time between consecutive model chunks of the same message",
+    ["tools"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+STREAM_DURATION = Histogram(
+    "chat_stream_duration_seconds",
+    "Total duration of a chat stream",
+    ["tools", "outcome"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320),
+)
+STREAM_FRAMES = Histogram(
+    "chat_stream_frames",
+    "Data stream frames emitted per chat stream",
+    ["tools"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+STREAM_BYTES = Histogram(
+    "chat_stream_bytes",
+    "Bytes emitted per chat stream",
+    ["tools"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+STREAM_FRAMES_PER_SECOND = Histogram(
+    "chat_stream_frames_per_second",
+    "Average frame rate of a chat stream",
+    ["tools"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+CHAT_TOKENS = Counter(
+    "chat_tokens_total",
+    "Tokens reported by the model provider for chat turns",
+    ["type"],
+)
+
+
+def encode_frame(code: str, payload: Any) -> str:
+    """Serialize a single data stream frame."""
+    return f"{code}:{json.dumps(payload)}\n"
+
+
+class FrameCoalescer:
+    """Merges consecutive text, reasoning and tool-arg deltas into fewer frames.
+
+    Models often stream one token per chunk, so sending every chunk as its
+    own frame makes json encoding, ASGI sends and the client-side parser the
+    dominant per-stream cost. Deltas of the same kind are buffered until the
+    window elapses, the size limit is reached, or a frame of another kind
+    needs to go out (frame order is always preserved).
+    """
+
+    MERGEABLE = {TEXT_DELTA, REASONING_DELTA, TOOL_CALL_ARGS_DELTA}
+
+    def __init__(
+        self,
+        window_ms: int = COALESCE_WINDOW_MS,
+        max_bytes: int = COALESCE_MAX_BYTES,
+    ):
+        self.window = max(window_ms, 0) / 1000
+        self.max_bytes = max_bytes
+        self._code: Optional[str] = None
+        self._tool_call_id: Optional[str] = None
+        self._parts: List[str] = []
+        self._size = 0
+        self._deadline: Optional[float] = None
+
+    def push(self, code: str, payload: Any) -> List[str]:
+        """Add a frame and return the encoded frames that are ready to send."""
+        if code not in self.MERGEABLE or self.window == 0:
+            return self.flush() + [encode_frame(code, payload)]
+
+        if code == TOOL_CALL_ARGS_DELTA:
+            tool_call_id = payload["toolCallId"]
+            text = payload["argsTextDelta"]
+        else:
+            tool_call_id = None
+            text = payload
+
+        frames = []
+        if self._parts and (code != self._code or tool_call_id != self._tool_call_id):
+            frames.extend(self.flush())
+
+        if not self._parts:
+            self._code = code
+            self._tool_call_id = tool_call_id
+            self._deadline = time.monotonic() + self.window
+
+        self._parts.append(text)
+        self._size += len(text)
+
+        if self._size >= self.max_bytes or time.monotonic() >= self._deadline:
+            frames.extend(self.flush())
+
+        return frames
+
+    def flush(self) -> List[str]:
+        """Encode whatever is buffered."""
+        if not self._parts:
+            return []
+
+        text = "".join(self._parts)
+        if self._code == TOOL_CALL_ARGS_DELTA:
+            payload: Any = {"toolCallId": self._tool_call_id, "argsTextDelta": text}
+        else:
+            payload = text
+        code = typing.cast(str, self._code)
+
+        self._code = None
+        self._tool_call_id = None
+        self._parts = []
+        self._size = 0
+        self._deadline = None
+
+        return [encode_frame(code, payload)]
+
+    def time_until_flush(self) -> Optional[float]:
+        """Seconds until buffered deltas must be flushed, or None if empty."""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+
+class ReasoningTagParser:
+    """Incrementally splits streamed text into reasoning and answer text.
+
+    State is carried across chunks for the lifetime of one stream, so a
+    ``<reasoning>`` block (or a tag itself) split over several chunks is
+    routed correctly. Text is scanned in a single linear pass; only a
+    possible partial tag at the end of a chunk is held back for the next one.
+    """
+
+    def __init__(self):
+        self.in_reasoning = False
+        self._pending = ""
+
+    def feed(self, text: str) -> List[Frame]:
+        """Consume a chunk and return (frame type, text) pieces in order."""
+        data = self._pending + text if self._pending else text
+        self._pending = ""
+        frames: List[Frame] = []
+        pos = 0
+
+        while pos < len(data):
+            tag = REASONING_CLOSE_TAG if self.in_reasoning else REASONING_OPEN_TAG
+            code = REASONING_DELTA if self.in_reasoning else TEXT_DELTA
+
+            idx = data.find(tag, pos)
+            if idx != -1:
+                if idx > pos:
+                    frames.append((code, data[pos:idx]))
+                pos = idx + len(tag)
+                self.in_reasoning = not self.in_reasoning
+                continue
+
+            # Hold back a trailing "<..." that could still become the tag
+            cut = len(data)
+            lt = data.rfind("<", max(pos, len(data) - len(tag) + 1))
+            if lt != -1 and tag.startswith(data[lt:]):
+                cut = lt
+                self._pending = data[lt:]
+            if cut > pos:
+                frames.append((code, data[pos:cut]))
+            break
+
+        return frames
+
+    def flush(self) -> List[Frame]:
+        """Release text held back as a possible partial tag."""
+        if not self._pending:
+            return []
+        code = REASONING_DELTA if self.in_reasoning else TEXT_DELTA
+        text, self._pending = self._pending, ""
+        return [(code, text)]
 
 
 def handle_tool_message(msg: ToolMessage):
     """
-    Handle ToolMessage - processes tool results and yields ToolCallResult (a:) chunks
+    Handle ToolMessage - processes tool results and yields ToolCallResult (a:) frames
     """
     tool_call_id = msg.tool_call_id
     print(f"  🛠️ Received tool result for {tool_call_id}")
@@ -30,14 +284,14 @@ def handle_tool_message(msg: ToolMessage):
             result_content = result_content[:10000] + "\n\n... (truncated)"
             print(f"  ⚠️ Tool result truncated (original length: {len(msg.content)})")
 
-        # Create the payload - json.dumps will handle all escaping
+        # Validate the payload here so a bad result is reported as a tool error
         payload = {"toolCallId": tool_call_id, "result": result_content}
-        payload_json = json.dumps(payload)
+        json.dumps(payload)
 
         print(
             f"  📤 Sending tool result for {tool_call_id}: {len(result_content)} chars"
         )
-        yield f"a:{payload_json}\n"
+        yield TOOL_CALL_RESULT, payload
 
     except Exception as tool_error:
         print(f"  ❌ Error sending tool result: {tool_error}")
@@ -45,54 +299,26 @@ def handle_tool_message(msg: ToolMessage):
 
         traceback.print_exc()
         # Send error message instead
-        error_payload = json.dumps(
-            {
-                "toolCallId": tool_call_id,
-                "isError": True,
-                "result": f"Error: {str(tool_error)}",
-            }
-        )
-        yield f"a:{error_payload}\n"
+        yield TOOL_CALL_RESULT, {
+            "toolCallId": tool_call_id,
+            "isError": True,
+            "result": f"Error: {str(tool_error)}",
+        }
 
 
 def handle_ai_message(
     msg: typing.Union[AIMessage, AIMessageChunk],
     tool_calls_by_idx: dict,
     tool_calls: dict,
-    accumulated_text: str,
-    token_count: int,
+    reasoning_parser: ReasoningTagParser,
 ):
     """
     Handle AIMessage/AIMessageChunk - processes text content, reasoning, and tool calls
-    Returns tuple of (accumulated_text, token_count)
+    Yields (frame type, payload) tuples
     """
-    # Handle text content - parse out reasoning tags and send appropriately
+    # Route text to ReasoningDelta (g:) or TextDelta (0:) based on reasoning tags
     if msg.content:
-        content = str(msg.content)
-
-        # Find all reasoning blocks and their positions
-        last_end = 0
-        for match in REASONING_PATTERN.finditer(content):
-            # Send any text before this reasoning block as TextDelta (0:)
-            text_before = content[last_end : match.start()]
-            if text_before:
-                yield f"0:{json.dumps(text_before)}\n"
-                accumulated_text += text_before
-                token_count += len(text_before.split())
-
-            # Send the reasoning content as ReasoningDelta (g:)
-            reasoning_content = match.group(1)
-            if reasoning_content:
-                yield f"g:{json.dumps(reasoning_content)}\n"
-
-            last_end = match.end()
-
-        # Send any remaining text after the last reasoning block as TextDelta (0:)
-        remaining_text = content[last_end:]
-        if remaining_text:
-            yield f"0:{json.dumps(remaining_text)}\n"
-            accumulated_text += remaining_text
-            token_count += len(remaining_text.split())
+        yield from reasoning_parser.feed(str(msg.content))
 
     # Handle tool calls
     if hasattr(msg, "tool_calls") and msg.tool_calls:
@@ -108,7 +334,7 @@ def handle_ai_message(
 
             # Send StartToolCall (b:)
             print(f"  📤 Sending tool call start: {tool_name} ({tool_call_id})")
-            yield f"b:{json.dumps({'toolCallId': tool_call_id, 'toolName': tool_name})}\n"
+            yield TOOL_CALL_START, {"toolCallId": tool_call_id, "toolName": tool_name}
 
             # Send tool args immediately if available
             tool_args = tool_call.get("args", {})
@@ -120,7 +346,10 @@ def handle_ai_message(
                     else str(tool_args)
                 )
                 print(f"  📤 Sending tool args: {len(args_str)} chars")
-                yield f"c:{json.dumps({'toolCallId': tool_call_id, 'argsTextDelta': args_str})}\n"
+                yield TOOL_CALL_ARGS_DELTA, {
+                    "toolCallId": tool_call_id,
+                    "argsTextDelta": args_str,
+                }
 
     # Handle streaming tool call chunks
     if hasattr(msg, "tool_call_chunks") and msg.tool_call_chunks:
@@ -144,40 +373,271 @@ def handle_ai_message(
             # Accumulate args and send ToolCallArgsTextDelta (c:)
             if tool_call_id != -1 and args_chunk:
                 tool_calls[tool_call_id]["args"] += args_chunk
-                yield f"c:{json.dumps({'toolCallId': tool_call_id, 'argsTextDelta': args_chunk})}\n"
+                yield TOOL_CALL_ARGS_DELTA, {
+                    "toolCallId": tool_call_id,
+                    "argsTextDelta": args_chunk,
+                }
 
 
-async def generate_stream(
-    graph: CompiledStateGraph,
-    input_message: Sequence[HumanMessage],
-    conversation_id: str,
-):
-    # Generate unique message ID
-    message_id = str(uuid.uuid4())
+class StreamStats:
+    """Latency, volume and token figures of one chat stream.
 
-    try:
-        # Send StartStep (f:) - Start of message processing
-        chunk = f"f:{json.dumps({'messageId': message_id})}\n"
-        if DEBUG_STREAM:
-            print(f"  📤 SENDING CHUNK: {chunk.strip()}")
-        yield chunk
-    except (GeneratorExit, Exception) as e:
-        print(f"Error sending start step: {e}")
-        return
+    Timings are measured on frames as they come out of the handlers, before
+    coalescing, so they reflect when the model produced them. Token usage is
+    summed over every model call of the turn (tool round-trips and history
+    compaction included).
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.first_tool_call_at: Optional[float] = None
+        self.chunk_gaps: List[float] = []
+        self.frames = 0
+        self.bytes = 0
+        self.outcome = "completed"
+        self.usage: Optional[UsageMetadata] = None
+        self._last_chunk_id: Optional[str] = None
+        self._last_chunk_at = 0.0
+
+    def on_usage(self, msg: typing.Union[AIMessage, AIMessageChunk]):
+        if msg.usage_metadata:
+            self.add_usage(msg.usage_metadata)
+
+    def add_usage(self, usage: UsageMetadata):
+        self.usage = add_usage(self.usage, usage)
+
+    def usage_totals(self) -> Dict[str, int]:
+        """Prompt, completion and cached prompt tokens of the turn so far."""
+        usage = self.usage or {}
+        details = usage.get("input_token_details") or {}
+        return {
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "cached_prompt_tokens": details.get("cache_read", 0),
+        }
+
+    def on_model_chunk(self, msg: AIMessageChunk):
+        now = time.monotonic()
+        if msg.id is not None and msg.id == self._last_chunk_id:
+            self.chunk_gaps.append(now - self._last_chunk_at)
+        self._last_chunk_id = msg.id
+        self._last_chunk_at = now
+
+    def on_frame(self, code: str):
+        if self.first_token_at is None and code in (TEXT_DELTA, REASONING_DELTA):
+            self.first_token_at = time.monotonic()
+        elif self.first_tool_call_at is None and code == TOOL_CALL_START:
+            self.first_tool_call_at = time.monotonic()
+
+    def on_sent(self, chunk: str):
+        self.frames += chunk.count("\n")
+        # Frames are json.dumps output, which is ASCII-only
+        self.bytes += len(chunk)
+
+    def record(self):
+        duration = time.monotonic() - self.started
+        tools = "used" if self.first_tool_call_at is not None else "none"
+
+        if self.first_token_at is not None:
+            STREAM_TIME_TO_FIRST_TOKEN.observe(self.first_token_at - self.started, tools=tools)
+        if self.first_tool_call_at is not None:
+            STREAM_TIME_TO_FIRST_TOOL_CALL.observe(
+                self.first_tool_call_at - self.started, tools=tools
+            )
+        for gap in self.chunk_gaps:
+            STREAM_INTER_CHUNK_GAP.observe(gap, tools=tools)
+        STREAM_DURATION.observe(duration, tools=tools, outcome=self.outcome)
+        STREAM_FRAMES.observe(self.frames, tools=tools)
+        STREAM_BYTES.observe(self.bytes, tools=tools)
+        if duration > 0:
+            STREAM_FRAMES_PER_SECOND.observe(self.frames / duration, tools=tools)
+        for token_type, count in self.usage_totals().items():
+            if count:
+                CHAT_TOKENS.inc(count, type=token_type)
+
+
+_STREAM_END = object()
+_STREAM_CANCELLED = object()
+
+
+class _UsageReport(NamedTuple):
+    """Usage of a model call that is not streamed (e.g. the summarizer)."""
+
+    usage: UsageMetadata
+
+# Keeps detached cleanup tasks alive until they finish
+_background_tasks: set = set()
+
+
+def _spawn_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+class GraphStreamRun:
+    """One chat turn running through the graph in a background task.
+
+    Streamed (message, metadata) items are pushed to ``queue``. The run can
+    be cancelled at any point (e.g. when the client disconnects); the model
+    call and any awaiting tool are cancelled and the thread is left in a
+    consistent state by recording what was produced so far.
+    """
+
+    def __init__(
+        self,
+        graph: CompiledStateGraph,
+        input_message: Sequence[HumanMessage],
+        conversation_id: str,
+    ):
+        self.graph = graph
+        self.input_message = input_message
+        self.conversation_id = conversation_id
+        self.config = {"configurable": {"thread_id": conversation_id}}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # Chunks of the model response currently being streamed
+        self._partial_chunks: List[AIMessageChunk] = []
+        self._cancel_started = False
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        cancelled = False
+        try:
+            # Drive the graph asynchronously so a slow LLM or tool call never
+            # blocks the event loop for other streams on this worker.
+            async for mode, chunk in self.graph.astream(
+                {"messages": self.input_message},
+                config=self.config,
+                stream_mode=["messages", "custom"],
+            ):
+                if mode == "custom":
+                    # Nodes report the usage of model calls kept out of
+                    # the messages stream through the stream writer
+                    if isinstance(chunk, dict) and chunk.get("usage"):
+                        self.queue.put_nowait(_UsageReport(chunk["usage"]))
+                    continue
+                msg, metadata = chunk
+                if isinstance(msg, AIMessageChunk):
+                    if self._partial_chunks and self._partial_chunks[0].id != msg.id:
+                        self._partial_chunks = []
+                    self._partial_chunks.append(msg)
+                self.queue.put_nowait((msg, metadata))
+            # The finish frame is only sent once the turn is persisted
+            await flush_checkpoints(self.conversation_id)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            self.queue.put_nowait(e)
+        finally:
+            self.queue.put_nowait(_STREAM_CANCELLED if cancelled else _STREAM_END)
+
+    async def cancel(self):
+        """Cancel the run and checkpoint the partial turn. Safe to call twice."""
+        if self._cancel_started:
+            return
+        self._cancel_started = True
+
+        if not self.task.done():
+            self.task.cancel()
+        await asyncio.wait([self.task])
+
+        if self.task.cancelled():
+            try:
+                await self._record_partial_turn()
+            except Exception as e:
+                print(f"  ⚠️ Failed to record partial turn: {e}")
+        try:
+            await flush_checkpoints(self.conversation_id)
+        except Exception as e:
+            print(f"  ⚠️ Failed to persist the interrupted turn: {e}")
+
+    async def _record_partial_turn(self):
+        """Close the interrupted turn so the thread stays valid for the next one.
+
+        Tool calls that never got a result are answered with a cancellation
+        message and any text already streamed is kept as the final AI message.
+        """
+        state = await self.graph.aget_state(self.config)
+        messages = state.values.get("messages", []) if state.values else []
+        if not messages:
+            return
+
+        updates = []
+        last_message = messages[-1]
+        if isinstance(last_message, AIMessage) and last_message.tool_calls:
+            for tool_call in last_message.tool_calls:
+                updates.append(
+                    ToolMessage(
+                        content="Tool call cancelled: the client disconnected.",
+                        tool_call_id=tool_call["id"],
+                        name=tool_call["name"],
+                        status="error",
+                    )
+                )
+
+        existing_ids = {m.id for m in messages}
+        if self._partial_chunks and self._partial_chunks[0].id not in existing_ids:
+            partial = add_ai_message_chunks(*self._partial_chunks)
+            if partial.content:
+                updates.append(
+                    AIMessage(
+                        content=partial.content,
+                        id=partial.id,
+                        response_metadata={"finish_reason": "client_disconnected"},
+                    )
+                )
+
+        if updates:
+            # Recorded as the agent's output so the graph routes to END
+            await self.graph.aupdate_state(
+                self.config, {"messages": updates}, as_node="agent"
+            )
+            print(f"  ✂️ Recorded partial turn ({len(updates)} messages)")
+
+
+async def encode_turn(run: GraphStreamRun, message_id: str, stats: StreamStats):
+    """Turn the items of a graph run into encoded data stream frames."""
+    # Send StartStep (f:) - Start of message processing
+    yield encode_frame(START_STEP, {"messageId": message_id})
 
     tool_calls = {}
     tool_calls_by_idx = {}
-    accumulated_text = ""
-    token_count = 0
+    reasoning_parser = ReasoningTagParser()
+    coalescer = FrameCoalescer()
+    queue = run.queue
 
     if DEBUG_STREAM:
         stream_msg_count = 0
     try:
-        for msg, metadata in graph.stream(
-            {"messages": input_message},
-            config={"configurable": {"thread_id": conversation_id}},
-            stream_mode="messages",
-        ):
+        while True:
+            if queue.empty():
+                # Wake up in time to flush buffered deltas even while we are
+                # waiting for the next chunk from the model.
+                timeout = coalescer.time_until_flush()
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    for chunk in coalescer.flush():
+                        yield chunk
+                    continue
+            else:
+                item = queue.get_nowait()
+
+            if item is _STREAM_END:
+                break
+            if item is _STREAM_CANCELLED:
+                stats.outcome = "cancelled"
+                return
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, _UsageReport):
+                stats.add_usage(item.usage)
+                continue
+
+            msg, metadata = item
             if DEBUG_STREAM:
                 print(f"\n--- Streamed Message Chunk #{stream_msg_count} ---")
                 print("type:", type(msg))
@@ -186,48 +646,294 @@ async def generate_stream(
                 stream_msg_count += 1
             try:
                 if isinstance(msg, ToolMessage):
-                    for chunk in handle_tool_message(msg):
-                        if DEBUG_STREAM:
-                            print(f"  📤 SENDING CHUNK: {chunk.strip()}")
-                        yield chunk
-
+                    frames = handle_tool_message(msg)
                 elif isinstance(msg, AIMessageChunk) or isinstance(msg, AIMessage):
-                    for chunk in handle_ai_message(
-                        msg,
-                        tool_calls_by_idx,
-                        tool_calls,
-                        accumulated_text,
-                        token_count,
-                    ):
-                        if isinstance(chunk, tuple):
-                            accumulated_text, token_count = chunk
-                        else:
-                            if DEBUG_STREAM:
-                                print(f"  📤 SENDING CHUNK: {chunk.strip()}")
-                            yield chunk
-            except GeneratorExit:
-                # Client disconnected, stop processing
-                return
-            except Exception as yield_error:
-                print(f"Error during message processing: {yield_error}")
+                    if isinstance(msg, AIMessageChunk):
+                        stats.on_model_chunk(msg)
+                    stats.on_usage(msg)
+                    frames = handle_ai_message(
+                        msg, tool_calls_by_idx, tool_calls, reasoning_parser
+                    )
+                else:
+                    continue
+
+                encoded = []
+                for code, payload in frames:
+                    stats.on_frame(code)
+                    encoded.extend(coalescer.push(code, payload))
+            except Exception as processing_error:
+                print(f"Error during message processing: {processing_error}")
                 # Continue with next message instead of breaking completely
                 continue
+            for chunk in encoded:
+                yield chunk
+
+        # Send FinishMessage (d:) with the provider-reported usage of the turn
+        for code, text in reasoning_parser.flush():
+            for chunk in coalescer.push(code, text):
+                yield chunk
+        for chunk in coalescer.flush():
+            yield chunk
+        usage = stats.usage_totals()
+        yield encode_frame(
+            FINISH_MESSAGE,
+            {
+                "finishReason": "stop",
+                "usage": {
+                    "promptTokens": usage["prompt_tokens"],
+                    "completionTokens": usage["completion_tokens"],
+                    "cachedPromptTokens": usage["cached_prompt_tokens"],
+                },
+            },
+        )
 
-        # Send FinishMessage (d:) with usage stats
-        try:
-            chunk = f"d:{json.dumps({'finishReason': 'stop', 'usage': {'promptTokens': token_count, 'completionTokens': token_count}})}\n"
-            if DEBUG_STREAM:
-                print(f"  📤 SENDING CHUNK: {chunk.strip()}")
+    except Exception as e:
+        print(f"Stream processing error: {e}")
+        stats.outcome = "error"
+        # Flush text that was already generated before reporting the error
+        for chunk in coalescer.flush():
             yield chunk
-        except (GeneratorExit, Exception) as e:
-            print(f"Error sending finish message: {e}")
-            return
+        # Send Error (3:) with generic user-friendly message
+        yield f'{ERROR}:"An error occurred, please try again."\n'
+
+
+class TurnReplay(NamedTuple):
+    """A previously streamed turn to answer with instead of running the graph.
+
+    ``frames`` are the encoded frames between the start and finish frames;
+    ``messages`` are the messages the turn added to its thread.
+    """
+
+    messages: Sequence[BaseMessage]
+    frames: Sequence[str]
+
 
+async def encode_replay(
+    graph: CompiledStateGraph,
+    input_message: Sequence[HumanMessage],
+    conversation_id: str,
+    replay: TurnReplay,
+    message_id: str,
+    stats: StreamStats,
+):
+    """Record a replayed turn in the thread and yield its frames."""
+    yield encode_frame(START_STEP, {"messageId": message_id})
+    try:
+        # Recorded as the agent's output so the graph routes to END
+        await graph.aupdate_state(
+            {"configurable": {"thread_id": conversation_id}},
+            {"messages": [*input_message, *replay.messages]},
+            as_node="agent",
+        )
+        await flush_checkpoints(conversation_id)
     except Exception as e:
         print(f"Stream processing error: {e}")
+        stats.outcome = "error"
+        yield f'{ERROR}:"An error occurred, please try again."\n'
+        return
+
+    for chunk in replay.frames:
+        yield chunk
+    yield encode_frame(
+        FINISH_MESSAGE,
+        {
+            "finishReason": "stop",
+            "usage": {"promptTokens": 0, "completionTokens": 0, "cachedPromptTokens": 0},
+        },
+    )
+
+
+class ChatStream:
+    """A chat turn whose frames are buffered so clients can re-attach.
+
+    The graph run and frame encoding happen in a background task that writes
+    into a ``ReplayBuffer``; HTTP responses are just subscribers reading from
+    an offset. When the last subscriber goes away the run is kept alive for
+    ``RESUME_GRACE_SECONDS`` before it is cancelled, and a finished stream
+    stays available for ``REPLAY_RETENTION_SECONDS``.
+
+    With ``replay`` the graph is not run; the given turn is written to the
+    thread and its frames are streamed instead. With ``capture_frames`` the
+    frames between the start and finish frames are kept in
+    ``captured_frames``, and ``on_finished`` is awaited in the background
+    with the stream once the turn has ended.
+    """
+
+    def __init__(
+        self,
+        graph: CompiledStateGraph,
+        input_message: Sequence[HumanMessage],
+        conversation_id: str,
+        userid: Optional[str] = None,
+        on_complete: Optional[Callable[[], None]] = None,
+        replay: Optional[TurnReplay] = None,
+        capture_frames: bool = False,
+        on_finished: Optional[Callable[["ChatStream"], Awaitable[None]]] = None,
+    ):
+        self.message_id = str(uuid.uuid4())
+        self.graph = graph
+        self.conversation_id = conversation_id
+        self.userid = userid
+        self.buffer = ReplayBuffer(REPLAY_BUFFER_FRAMES)
+        self.stats = StreamStats()
+        if replay is None:
+            self.run: Optional[GraphStreamRun] = GraphStreamRun(
+                graph, input_message, conversation_id
+            )
+            self._frames = encode_turn(self.run, self.message_id, self.stats)
+        else:
+            self.run = None
+            self.stats.outcome = "replayed"
+            self._frames = encode_replay(
+                graph, input_message, conversation_id, replay, self.message_id, self.stats
+            )
+        self.captured_frames: Optional[List[str]] = [] if capture_frames else None
+        self._on_finished = on_finished
+        self._subscribers = 0
+        self._grace_timer: Optional[asyncio.TimerHandle] = None
+        self.task = asyncio.create_task(self._pump())
+        if on_complete is not None:
+            self.task.add_done_callback(lambda _: on_complete())
+        # Nobody is attached until the response starts streaming; this also
+        # covers a client that goes away before reading anything
+        self._start_grace_timer(
+            max(RESUME_GRACE_SECONDS, DISCONNECT_POLL_MS / 1000)
+        )
+
+    def _capture(self, chunk: str):
+        frames = [
+            line + "\n"
+            for line in chunk.splitlines()
+            if line and not line.startswith((f"{START_STEP}:", f"{FINISH_MESSAGE}:"))
+        ]
+        if frames:
+            typing.cast(List[str], self.captured_frames).append("".join(frames))
+
+    async def _pump(self):
         try:
-            # Send Error (3:) with generic user-friendly message
-            yield f'3:"An error occurred, please try again."\n'
-        except (GeneratorExit, Exception):
-            # Stream already closed, just return
+            async for chunk in self._frames:
+                if DEBUG_STREAM:
+                    print(f"  📤 BUFFERING CHUNK: {chunk.strip()}")
+                self.stats.on_sent(chunk)
+                if self.captured_frames is not None:
+                    self._capture(chunk)
+                await self.buffer.append(chunk)
+        finally:
+            self.stats.record()
+            if self.userid and self.stats.usage:
+                _spawn_background(self._save_usage())
+            if self._grace_timer is not None:
+                self._grace_timer.cancel()
+                self._grace_timer = None
+            if self.run is not None and (
+                not self.run.task.done() or self.run.task.cancelled()
+            ):
+                _spawn_background(self.run.cancel())
+            if self._on_finished is not None:
+                _spawn_background(self._on_finished(self))
+            await self.buffer.close()
+            asyncio.get_running_loop().call_later(
+                REPLAY_RETENTION_SECONDS, _chat_streams.pop, self.message_id, None
+            )
+
+    async def _save_usage(self):
+        try:
+            await db_manager.record_token_usage_async(
+                self.conversation_id, typing.cast(str, self.userid), self.stats.usage_totals()
+            )
+        except Exception as e:
+            print(f"  ⚠️ Failed to record token usage: {e}")
+
+    def _attach(self):
+        self._subscribers += 1
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+
+    def _detach(self):
+        self._subscribers = max(self._subscribers - 1, 0)
+        if self._subscribers or self.task.done():
             return
+        if RESUME_GRACE_SECONDS <= 0:
+            self._expire()
+        else:
+            self._start_grace_timer(RESUME_GRACE_SECONDS)
+
+    def _start_grace_timer(self, delay: float):
+        self._grace_timer = asyncio.get_running_loop().call_later(
+            delay, self._expire
+        )
+
+    def _expire(self):
+        self._grace_timer = None
+        if self._subscribers == 0 and not self.task.done() and self.run is not None:
+            print(f"  🔌 No client attached to {self.message_id}, cancelling chat run")
+            _spawn_background(self.run.cancel())
+
+    async def subscribe(self, offset: int = 0, request: Optional[Request] = None):
+        """Yield frames from ``offset`` on, following the live stream."""
+        self._attach()
+        try:
+            while True:
+                try:
+                    frames = self.buffer.read(offset)
+                except FramesEvictedError as e:
+                    print(f"  ⚠️ {e}")
+                    yield f'{ERROR}:"The stream can no longer be resumed, please try again."\n'
+                    return
+
+                if frames:
+                    offset += len(frames)
+                    if DEBUG_STREAM:
+                        print(f"  📤 SENDING {len(frames)} CHUNKS up to offset {offset}")
+                    yield "".join(frames)
+                    continue
+
+                if self.buffer.closed:
+                    return
+
+                if not await self.buffer.wait(offset, DISCONNECT_POLL_MS / 1000):
+                    if request is not None and await request.is_disconnected():
+                        print(f"  🔌 Client detached from {self.message_id} at frame {offset}")
+                        return
+        finally:
+            self._detach()
+
+
+# message_id -> live or recently finished chat stream
+_chat_streams: Dict[str, ChatStream] = {}
+
+
+def get_chat_stream(message_id: str) -> Optional[ChatStream]:
+    """Look up a live or recently finished chat stream by message id."""
+    return _chat_streams.get(message_id)
+
+
+def generate_stream(
+    graph: CompiledStateGraph,
+    input_message: Sequence[HumanMessage],
+    conversation_id: str,
+    request: Optional[Request] = None,
+    userid: Optional[str] = None,
+    on_complete: Optional[Callable[[], None]] = None,
+    replay: Optional[TurnReplay] = None,
+    capture_frames: bool = False,
+    on_finished: Optional[Callable[[ChatStream], Awaitable[None]]] = None,
+):
+    """Start a chat turn and return the response stream for the first client.
+
+    ``on_complete`` is called once the graph run has ended, however it ended.
+    See ``ChatStream`` for ``replay``, ``capture_frames`` and ``on_finished``.
+    """
+    stream = ChatStream(
+        graph,
+        input_message,
+        conversation_id,
+        userid,
+        on_complete,
+        replay=replay,
+        capture_frames=capture_frames,
+        on_finished=on_finished,
+    )
+    _chat_streams[stream.message_id] = stream
+    return stream.subscribe(0, request)
@@ -567,8 +567,9 @@ export function extractLangchainMessageAttachments(content: MessageContent): Com
             content: imageContent,
           });
         }
-        // Handle file attachments (if they exist in the future)
-        else if (item.type === "file" && "data" in item && typeof item.data === "string" && "mime_type" in item && typeof item.mime_type === "string") {
+        // Handle file attachments (inline base64, or chatbot:// references
+        // for files the backend moved to blob storage)
+        else if (item.type === "file" && (("data" in item && typeof item.data === "string") || ("url" in item && typeof item.url === "string")) && "mime_type" in item && typeof item.mime_type === "string") {
           const filename = ("filename" in item && typeof item.filename === "string") 
             ? item.filename 
             : `file-${attachmentIndex}.${getFileExtensionFromMimeType(item.mime_type)}`;
@@ -576,7 +577,7 @@ export function extractLangchainMessageAttachments(content: MessageContent): Com
           const fileContent: ThreadUserMessagePart[] = [{
             type: "file" as const,
             filename,
-            data: item.data,
+            data: "data" in item && typeof item.data === "string" ? item.data : String(item.url),
             mimeType: item.mime_type,
           }];
 